@@ -0,0 +1,87 @@
+import math
+from functools import lru_cache
+
+import tiktoken
+
+from csv_stream import EXPECTED_COLUMNS
+
+COMPLETION_SAFETY_MARGIN = 0.8  # share of the completion budget a batch is planned to use
+RESPONSE_OVERHEAD_TOKENS = 300  # CSV header line and any stray text around it
+PRIOR_WEIGHT = 10  # questions' worth of confidence given to the static estimate
+
+METADATA_WORDS = 30  # subject, topic, sub-topic, PDF name, page, year, ...
+
+# Approximate word counts per field, following the explanation-length rules in the prompt
+QUESTION_TYPE_PROFILES = {
+    "MCQ": {"question": 40, "options": 4, "option_words": 8, "answer": 8, "explanation": 220},
+    "Fill in the Blanks": {"question": 30, "options": 4, "option_words": 3, "answer": 3, "explanation": 180},
+    "Short Answer": {"question": 25, "options": 0, "option_words": 0, "answer": 60, "explanation": 180},
+    "Descriptive/Essay": {"question": 35, "options": 0, "option_words": 0, "answer": 300, "explanation": 250},
+    "Match the Following": {"question": 60, "options": 4, "option_words": 15, "answer": 15, "explanation": 220},
+    "True/False": {"question": 25, "options": 2, "option_words": 1, "answer": 1, "explanation": 150},
+}
+
+SAMPLE_TEXT = {
+    "English": "the constitution of india provides for a parliamentary form of government which is federal in structure with certain unitary features".split(),
+    "Hindi": "भारत का संविधान संसदीय शासन प्रणाली का प्रावधान करता है जो संरचना में संघीय है और इसमें कुछ एकात्मक विशेषताएं भी हैं".split(),
+}
+
+@lru_cache(maxsize=None)
+def encoding_for(model):
+    return tiktoken.encoding_for_model(model)
+
+def count_tokens(text, model="gpt-4o"):
+    return len(encoding_for(model).encode(text))
+
+def sample_text(language, words):
+    vocabulary = SAMPLE_TEXT[language]
+    return " ".join(vocabulary[i % len(vocabulary)] for i in range(words))
+
+@lru_cache(maxsize=None)
+def estimate_question_tokens(question_type, language, model="gpt-4o"):
+    profile = QUESTION_TYPE_PROFILES.get(question_type, QUESTION_TYPE_PROFILES["MCQ"])
+    languages = ["English", "Hindi"] if language == "Both" else [language]
+
+    fields = [sample_text("English", METADATA_WORDS)]
+    for field_language in languages:
+        fields.append(sample_text(field_language, profile["question"]))
+        fields.extend(sample_text(field_language, profile["option_words"]) for _ in range(profile["options"]))
+        fields.append(sample_text(field_language, profile["answer"]))
+        fields.append(sample_text(field_language, profile["explanation"]))
+
+    # Unused language columns are still emitted as empty fields
+    row = ",".join(f'"{field}"' for field in fields) + "," * (len(EXPECTED_COLUMNS) - len(fields)) + "\n"
+    return count_tokens(row, model)
+
+class BatchPlanner:
+    def __init__(self, question_types, language, max_completion_tokens, max_batch_size, model="gpt-4o"):
+        types = question_types or list(QUESTION_TYPE_PROFILES)
+        # Plan for the most expensive selected type until real usage says otherwise
+        self.prior_tokens_per_question = max(estimate_question_tokens(t, language, model) for t in types)
+        self.max_completion_tokens = max_completion_tokens
+        self.max_batch_size = max_batch_size
+        self.observed_tokens = 0
+        self.observed_questions = 0
+
+    def tokens_per_question(self):
+        prior_tokens = self.prior_tokens_per_question * PRIOR_WEIGHT
+        return (prior_tokens + self.observed_tokens) / (PRIOR_WEIGHT + self.observed_questions)
+
+    def batch_capacity(self, tokens_per_question=None):
+        budget = self.max_completion_tokens * COMPLETION_SAFETY_MARGIN - RESPONSE_OVERHEAD_TOKENS
+        return max(1, min(int(budget // (tokens_per_question or self.tokens_per_question())), self.max_batch_size))
+
+    def cell_capacity(self):
+        # From the prior alone, so a job is split into the same coverage cells when it is resumed
+        return self.batch_capacity(self.prior_tokens_per_question)
+
+    def next_batch_size(self, remaining_questions):
+        capacity = self.batch_capacity()
+        # Split the remainder evenly so the last batch is not a small straggler
+        num_batches = math.ceil(remaining_questions / capacity)
+        return math.ceil(remaining_questions / num_batches)
+
+    def observe(self, completion_tokens, question_count):
+        if completion_tokens and question_count > 0:
+            self.observed_tokens += completion_tokens
+            self.observed_questions += question_count
@@ -0,0 +1,100 @@
+import argparse
+import csv
+import io
+import random
+import time
+import tracemalloc
+
+import pandas as pd
+
+from csv_stream import EXPECTED_COLUMNS, CsvStreamParser
+
+# Compares the quote-aware columnar parser with the old line.split(',') path on
+# synthetic bilingual model output. Run from the repo root:
+#   python -m benchmarks.bench_csv_parser --rows 5000
+
+ENGLISH_WORDS = "the constitution of india provides for a parliamentary form of government, which is federal in structure".split()
+HINDI_WORDS = "भारत का संविधान संसदीय शासन प्रणाली का प्रावधान करता है, जो संरचना में संघीय है".split()
+
+def sentence(words, rng, length):
+    return " ".join(rng.choice(words) for _ in range(length))
+
+def explanation(words, rng):
+    return "\n\n".join(sentence(words, rng, 70) for _ in range(rng.randint(2, 3)))
+
+def synthetic_output(rows, seed=0, chunk_rows=10):
+    rng = random.Random(seed)
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    for i in range(rows):
+        # Every batch repeats the header, like the combined output of parallel runs
+        if i % chunk_rows == 0:
+            writer.writerow(EXPECTED_COLUMNS)
+        writer.writerow([
+            "General Knowledge", "Polity", "Fundamental Rights", "MCQ",
+            sentence(ENGLISH_WORDS, rng, 30) + "?", sentence(HINDI_WORDS, rng, 30) + "?",
+            *(sentence(ENGLISH_WORDS, rng, 6) for _ in range(4)),
+            *(sentence(HINDI_WORDS, rng, 6) for _ in range(4)),
+            sentence(ENGLISH_WORDS, rng, 6), sentence(HINDI_WORDS, rng, 6),
+            explanation(ENGLISH_WORDS, rng), explanation(HINDI_WORDS, rng),
+            "Medium", "Both", "PB-Polity.pdf", str(rng.randint(1, 400)), str(i + 1), str(rng.randint(2000, 2024)),
+        ])
+    return out.getvalue()
+
+def legacy_parse(csv_content):
+    # The previous process_csv_content body, minus the Streamlit calls
+    lines = csv_content.strip().split('\n')
+    header_line = None
+    data_lines = []
+    for line in lines:
+        if not header_line and ("Subject" in line and "Topic" in line):
+            header_line = line
+        elif line.strip():
+            data_lines.append(line)
+    rows = []
+    for line in data_lines:
+        fields = line.split(',')
+        row_dict = {col: 'N/A' for col in EXPECTED_COLUMNS}
+        for i, field in enumerate(fields):
+            if i < len(EXPECTED_COLUMNS):
+                row_dict[EXPECTED_COLUMNS[i]] = field.strip()
+        rows.append(row_dict)
+    return pd.DataFrame(rows).fillna('N/A')
+
+def streaming_parse(csv_content, chunk_size=4096):
+    parser = CsvStreamParser()
+    # Feed in chunks, as the run-event stream would
+    for start in range(0, len(csv_content), chunk_size):
+        parser.feed(csv_content[start:start + chunk_size])
+    parser.close()
+    return pd.DataFrame(parser.data)
+
+def measure(fn, csv_content, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = fn(csv_content)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    fn(csv_content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return df, min(times), peak
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CSV parsing of generated questions.")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    csv_content = synthetic_output(args.rows)
+    print(f"{args.rows} bilingual rows, {len(csv_content.encode('utf-8')) / 1e6:.1f} MB of CSV")
+    print(f"{'parser':<12}{'best time':>12}{'peak memory':>14}{'rows':>8}{'correct':>9}")
+    expected_years = set(str(year) for year in range(2000, 2025))
+    for name, fn in [("legacy", legacy_parse), ("streaming", streaming_parse)]:
+        df, best, peak = measure(fn, csv_content, args.repeat)
+        correct = int(df["Year of Original Question"].astype(str).isin(expected_years).sum())
+        print(f"{name:<12}{best * 1000:>10.1f}ms{peak / 1e6:>12.1f}MB{len(df):>8}{correct:>9}")
+
+if __name__ == "__main__":
+    main()
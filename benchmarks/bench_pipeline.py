@@ -0,0 +1,155 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+
+import pipeline
+from batching import BatchPlanner
+from fake_server import FakeAssistantsServer
+from metrics import MetricsRecorder, percentile
+from scheduler import RateLimitScheduler
+
+# Runs generate_questions_parallel_async against the local fake server over a grid of
+# concurrency levels, batch sizes and polling strategies. Run from the repo root:
+#   python -m benchmarks.bench_pipeline
+#   python -m benchmarks.bench_pipeline --quick --save benchmarks/baseline.json
+#   python -m benchmarks.bench_pipeline --quick --check benchmarks/baseline.json
+# --check exits non-zero when a scenario regresses by more than --tolerance against the baseline.
+
+STEADY_PROFILE = {
+    "run_seconds": 0.3,
+    "seconds_per_question": 0.02,
+    "latency": "lognormal",
+    "latency_sigma": 0.3,
+    "request_latency": 0.01,
+    "explanation_words": 60,
+    "seed": 7,
+}
+# Injected failures add retries with jittered backoff, so results vary more from run to run
+SERVER_PROFILES = {
+    "steady": STEADY_PROFILE,
+    "faulty": {**STEADY_PROFILE, "latency_sigma": 0.6, "failure_rate": 0.02, "expiry_rate": 0.01, "rate_limit_rate": 0.01},
+    # A few runs take many times the median, which is what hedging is for
+    "heavy-tail": {**STEADY_PROFILE, "latency_sigma": 1.2},
+}
+
+POLLING_STRATEGIES = {
+    "stream": {"STREAM_RUNS": True},
+    "stream-no-hedge": {"STREAM_RUNS": True, "HEDGE_BATCHES": False},
+    "poll-backoff": {"STREAM_RUNS": False, "POLLING_INTERVAL": 0.5, "POLLING_BACKOFF": 1.5},
+    "poll-fixed": {"STREAM_RUNS": False, "POLLING_INTERVAL": 0.5, "POLLING_BACKOFF": 1.0},
+}
+
+# "any" leaves subjects empty, so the job is one coverage cell; "subjects" spreads it over topic, type and difficulty cells
+JOB_SPECS = {
+    "any": ([], [], "", [], "", ["True/False"], 0, [], "English", "Create new", (2000, 2024)),
+    "subjects": (["English for SSC - All exams", "General Knowledge", "Mathematics"], [], "", [], "", ["Multiple Choice", "True/False"], 0,
+                 ["Easy", "Hard"], "English", "Create new", (2000, 2024)),
+}
+
+FULL_GRID = {"spec": list(JOB_SPECS), "concurrency": [4, 16, 64], "batch_size": [5, 20], "polling": list(POLLING_STRATEGIES)}
+HEDGE_GRID = {"spec": ["any"], "concurrency": [16], "batch_size": [5], "polling": ["stream", "stream-no-hedge"]}
+QUICK_GRID = {"spec": list(JOB_SPECS), "concurrency": [16], "batch_size": [5, 20], "polling": ["stream", "poll-backoff"]}
+
+# Metric name -> True when larger is better
+CHECKED_METRICS = {"questions_per_second": True, "p95_latency": False, "api_calls_per_question": False}
+
+class QuietEvents(pipeline.GenerationEvents):
+    def __init__(self):
+        self.errors = 0
+
+    def error(self, message):
+        self.errors += 1
+
+def run_scenario(profile, spec, num_questions, concurrency, batch_size, polling):
+    saved = {name: getattr(pipeline, name) for name in POLLING_STRATEGIES[polling]}
+    for name, value in POLLING_STRATEGIES[polling].items():
+        setattr(pipeline, name, value)
+    try:
+        with FakeAssistantsServer(**SERVER_PROFILES[profile]) as server:
+            os.environ["OPENAI_BASE_URL"] = server.base_url
+            params = JOB_SPECS[spec][:6] + (num_questions,) + JOB_SPECS[spec][7:]
+            planner = BatchPlanner(params[5], params[8], pipeline.MAX_COMPLETION_TOKENS, batch_size, pipeline.MODEL_NAME)
+            scheduler = RateLimitScheduler(initial_concurrency=concurrency, max_concurrency=concurrency)
+            metrics = MetricsRecorder()
+            events = QuietEvents()
+            start = time.perf_counter()
+            asyncio.run(pipeline.generate_questions_parallel_async(params, "fake-key", num_questions, planner, params[8], events,
+                                                                   scheduler=scheduler, metrics=metrics))
+            elapsed = time.perf_counter() - start
+            stats = dict(server.stats)
+    finally:
+        for name, value in saved.items():
+            setattr(pipeline, name, value)
+
+    durations = [batch.duration for batch in metrics.batches if batch.status is not None]
+    questions = metrics.summary()["questions"]
+    return {
+        "questions": questions,
+        "seconds": elapsed,
+        "questions_per_second": questions / elapsed,
+        "p50_latency": percentile(durations, 0.5),
+        "p95_latency": percentile(durations, 0.95),
+        "p99_latency": percentile(durations, 0.99),
+        "api_calls_per_question": stats["requests"] / questions if questions else None,
+        "rate_limited": stats["rate_limited"],
+        "errors": events.errors,
+    }
+
+def regressions(results, baseline, tolerance):
+    found = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for metric, higher_is_better in CHECKED_METRICS.items():
+            expected, actual = baseline[name].get(metric), result.get(metric)
+            if expected is None or actual is None:
+                continue
+            limit = expected * (1 - tolerance) if higher_is_better else expected * (1 + tolerance)
+            if (actual < limit) if higher_is_better else (actual > limit):
+                found.append(f"{name}: {metric} {actual:.3f} vs baseline {expected:.3f}")
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the generation pipeline against the fake Assistants server.")
+    parser.add_argument("--questions", type=int, default=200, help="questions per scenario")
+    parser.add_argument("--quick", action="store_true", help="run the small grid used in CI")
+    parser.add_argument("--hedge", action="store_true", help="compare runs with and without hedging (default profile: heavy-tail)")
+    parser.add_argument("--profile", choices=list(SERVER_PROFILES), help="fake server behaviour (default: steady with --quick, faulty otherwise)")
+    parser.add_argument("--save", help="write the results to this JSON file as a new baseline")
+    parser.add_argument("--check", help="compare against this baseline and exit 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative change before a metric counts as regressed")
+    args = parser.parse_args()
+
+    grid = HEDGE_GRID if args.hedge else QUICK_GRID if args.quick else FULL_GRID
+    profile = args.profile or ("heavy-tail" if args.hedge else "steady" if args.quick else "faulty")
+    print(f"{args.questions} questions per scenario against a {profile} fake server: {SERVER_PROFILES[profile]}")
+    print(f"{'scenario':<43}{'q/s':>8}{'p50':>8}{'p95':>8}{'p99':>8}{'calls/q':>9}{'429s':>6}{'errors':>8}")
+    results = {}
+    for spec, concurrency, batch_size, polling in itertools.product(grid["spec"], grid["concurrency"], grid["batch_size"], grid["polling"]):
+        # Scenarios without subjects keep their original names, so older baselines still apply
+        name = f"{profile}-c{concurrency}-b{batch_size}-{polling}" + ("" if spec == "any" else f"-{spec}")
+        result = run_scenario(profile, spec, args.questions, concurrency, batch_size, polling)
+        results[name] = result
+        print(f"{name:<43}{result['questions_per_second']:>8.1f}{result['p50_latency']:>7.2f}s{result['p95_latency']:>7.2f}s"
+              f"{result['p99_latency']:>7.2f}s{result['api_calls_per_question']:>9.2f}{result['rate_limited']:>6}{result['errors']:>8}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({name: {metric: result[metric] for metric in CHECKED_METRICS} for name, result in results.items()}, f, indent=2)
+            f.write("\n")
+    if args.check:
+        with open(args.check, encoding="utf-8") as f:
+            baseline = json.load(f)
+        found = regressions(results, baseline, args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.check}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import time
+
+import pyarrow as pa
+
+from benchmarks.bench_csv_parser import synthetic_output, streaming_parse
+from results import PAGE_SIZE, compact_results, language_columns, page_slice, results_to_csv
+
+# Session memory and per-rerun work for a finished job, before and after the compact result store.
+# Before: the joined CSV string, the processed frame and a fresh processed CSV for the download
+# button on every rerun, with the whole table and raw text sent to the browser. After: one compact
+# frame, one page sent per rerun and the CSV built only when a download is clicked.
+#   python -m benchmarks.bench_result_store --rows 5000
+
+def frame_bytes(df):
+    return int(df.memory_usage(deep=True).sum())
+
+def best_time(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare session memory and rerun time of the result store.")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    csv_content = synthetic_output(args.rows)
+    csv_bytes = len(csv_content.encode("utf-8"))
+
+    processed = streaming_parse(csv_content)
+    before_memory = csv_bytes + frame_bytes(processed)
+
+    def before_rerun():
+        # st.text_area and st.dataframe serialize everything; the download data is rebuilt each time
+        pa.Table.from_pandas(processed)
+        processed.to_csv(index=False)
+        return csv_content.encode("utf-8")
+
+    results = compact_results(csv_content)
+    after_memory = frame_bytes(results)
+    columns = language_columns("Both")
+
+    def after_rerun():
+        pa.Table.from_pandas(results.iloc[page_slice(1)])
+        pa.Table.from_pandas(results.iloc[page_slice(1)][columns])
+
+    print(f"{args.rows} bilingual rows, {csv_bytes / 1e6:.1f} MB of CSV, {PAGE_SIZE} rows per page")
+    print(f"{'':<8}{'session memory':>16}{'rerun':>10}")
+    print(f"{'before':<8}{before_memory / 1e6:>14.1f}MB{best_time(before_rerun, args.repeat) * 1000:>8.1f}ms")
+    print(f"{'after':<8}{after_memory / 1e6:>14.1f}MB{best_time(after_rerun, args.repeat) * 1000:>8.1f}ms")
+    print(f"CSV export on download: {best_time(lambda: results_to_csv(results), args.repeat) * 1000:.1f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from catalog import Catalog
+
+# Cold start and rerun cost of the Streamlit app, each measured in a fresh interpreter, plus the
+# sidebar option lists for a catalog of --subjects subjects. Run from the repo root:
+#   python -m benchmarks.bench_startup
+#   python -m benchmarks.bench_startup --check
+# --check exits non-zero when importing main.py takes longer than IMPORT_BUDGET on top of
+# Streamlit itself, or loads any of HEAVY_MODULES before an API key has been entered.
+
+IMPORT_BUDGET = 0.05  # seconds main.py may add to the import of streamlit
+HEAVY_MODULES = ["openai", "pandas", "numpy", "tiktoken", "httpx"]
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import streamlit
+streamlit_seconds = time.perf_counter() - start
+start = time.perf_counter()
+import main
+print(json.dumps({{"streamlit": streamlit_seconds, "main": time.perf_counter() - start,
+                   "heavy": [name for name in {HEAVY_MODULES!r} if name in sys.modules]}}))
+"""
+
+# Time to first paint is the first script run: with no API key the page stops at the key prompt
+PAINT_PROBE = f"""
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file("main.py", default_timeout=60)
+start = time.perf_counter()
+app.run()
+first_paint = time.perf_counter() - start
+reruns = []
+for _ in range(5):
+    start = time.perf_counter()
+    app.run()
+    reruns.append(time.perf_counter() - start)
+print(json.dumps({{"first_paint": first_paint, "rerun": min(reruns),
+                   "heavy": [name for name in {HEAVY_MODULES!r} if name in sys.modules]}}))
+"""
+
+def probe(code):
+    output = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def synthetic_catalog(num_subjects, topics_per_subject=30, pdfs_per_topic=3):
+    subjects = [f"Subject {s}" for s in range(num_subjects)]
+    topics = {subject: [f"Topic {s}.{t}" for t in range(topics_per_subject)] for s, subject in enumerate(subjects)}
+    pdf_names = {subject: {topic: [f"PB-{topic} part {p}.pdf" for p in range(pdfs_per_topic)] for topic in topics[subject]}
+                 for subject in subjects}
+    return subjects, topics, pdf_names
+
+def legacy_options(topics_map, pdf_names, subjects, topics):
+    # The option lists create_sidebar built on every rerun before the catalog
+    all_topics = []
+    for subject in subjects:
+        all_topics.extend(topics_map.get(subject, []))
+    pdf_options = []
+    for subject in subjects:
+        subject_pdfs = pdf_names.get(subject, {})
+        if isinstance(subject_pdfs, dict):
+            for topic in topics:
+                pdf_options.extend(subject_pdfs.get(topic, []))
+        else:
+            pdf_options.extend(subject_pdfs)
+    return list(set(all_topics)), list(set(pdf_options))
+
+def best_time(fn, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold start, first paint and rerun time of the app.")
+    parser.add_argument("--subjects", type=int, default=300, help="subjects in the synthetic catalog")
+    parser.add_argument("--check", action="store_true", help="exit 1 when the import budget is exceeded")
+    args = parser.parse_args()
+
+    imports = probe(IMPORT_PROBE)
+    paint = probe(PAINT_PROBE)
+    print(f"import streamlit {imports['streamlit'] * 1000:.0f}ms, import main {imports['main'] * 1000:.1f}ms "
+          f"(budget {IMPORT_BUDGET * 1000:.0f}ms), heavy modules: {', '.join(imports['heavy']) or 'none'}")
+    print(f"first paint {paint['first_paint'] * 1000:.0f}ms, rerun {paint['rerun'] * 1000:.1f}ms, "
+          f"heavy modules before a key: {', '.join(paint['heavy']) or 'none'}")
+
+    subjects, topics, pdf_names = synthetic_catalog(args.subjects)
+    build = best_time(lambda: Catalog(subjects, topics, pdf_names), repeat=3)
+    catalog = Catalog(subjects, topics, pdf_names)
+    selected_subjects = subjects[::10]
+    selected_topics = [topic for subject in selected_subjects for topic in topics[subject][:5]]
+    legacy = best_time(lambda: legacy_options(topics, pdf_names, selected_subjects, selected_topics))
+    cached = best_time(lambda: (catalog.topics_for(tuple(selected_subjects)), catalog.pdfs_for(tuple(selected_subjects), tuple(selected_topics))))
+    search = best_time(lambda: Catalog.search.__wrapped__(catalog, "topic 12"))
+    print(f"catalog of {args.subjects} subjects: built once in {build * 1000:.1f}ms; sidebar options per rerun "
+          f"{legacy * 1e6:.0f}us before, {cached * 1e6:.1f}us cached; uncached search {search * 1000:.2f}ms")
+
+    if args.check:
+        failures = []
+        if imports["main"] > IMPORT_BUDGET:
+            failures.append(f"import main took {imports['main'] * 1000:.1f}ms")
+        if imports["heavy"] or paint["heavy"]:
+            failures.append(f"heavy modules loaded before a key: {', '.join(sorted(set(imports['heavy'] + paint['heavy'])))}")
+        if failures:
+            print("Over budget: " + "; ".join(failures))
+            sys.exit(1)
+        print("Within the import budget")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import argparse
+
+import pipeline
+from batching import BatchPlanner, count_tokens
+from coverage import CoveragePlanner
+from prompts import avoid_section, prompt_token_counts
+from subject_data import TOPICS
+
+# Input tokens per question with the old single-template prompt and with the static prefix split
+# out. Plans a job the way the pipeline does and counts every batch's prompt with tiktoken:
+#   python -m benchmarks.prompt_tokens --batches 500
+
+CACHED_INPUT_RATE = 0.5  # cached input tokens are billed at half the input price (gpt-4o-mini, gpt-4o)
+CACHE_MIN_TOKENS = 1024  # the provider only caches prompts at least this long
+
+# The prompt as it was built before the split, for comparison only
+LEGACY_PROMPT = """
+You are an advanced AI assistant designed to generate high-quality exam questions for UPSC and other public service commission exams in India. You will use a comprehensive Knowledge Base (KB) of Previous Year Questions (PYQs) provided in the attached PDF files. Your goal is to emulate expert examiners' methods, ensuring precision, consistency, and adherence to the requested specifications.
+
+# Input Parameters:
+- **Subject(s):** {subjects}
+- **Topic(s):** {topics}
+- **Sub-Topic:** {sub_topic}
+- **Keywords:** {keywords}
+- **Question Type(s):** {question_types}
+- **Number of Questions:** {batch_size}
+- **Difficulty Level(s):** {difficulty_levels}
+- **Language:** {language}
+- **Question Source:** {question_source}
+- **Year Range:** {year_from} to {year_to}
+- **Reference Material:** {pdfs}
+
+# Instructions:
+
+Follow all the detailed steps provided previously to generate high-quality exam questions. Ensure that you strictly adhere to the output format specified, which is a CSV-friendly format with the following headers:
+
+"Subject", "Topic", "Sub-Topic", "Question Type", "Question Text (English)", "Question Text (Hindi)", "Option A (English)", "Option B (English)", "Option C (English)", "Option D (English)", "Option A (Hindi)", "Option B (Hindi)", "Option C (Hindi)", "Option D (Hindi)", "Correct Answer (English)", "Correct Answer (Hindi)", "Explanation (English)", "Explanation (Hindi)", "Difficulty Level", "Language", "Source PDF Name", "Source Page Number", "Original Question Number", "Year of Original Question"
+
+**Important Notes:**
+- Ensure all fields are populated correctly; if a field is not applicable, leave it blank.
+- Do not include any text before or after the CSV content.
+- **For any missing values**, leave that column blank (instead of skipping it).
+- **Ensure that every column is properly mapped** in the exact sequence specified in the header.
+- Ensure that the Correct Answer (English) field contains the full text of the correct option.
+- Explanations should be detailed, at least 2-3 paragraphs, and explain why other options are not suitable.
+- Use only information that can be directly verified from the Knowledge Base.
+- If no relevant entry is found in the Knowledge Base, respond with: "Not found in knowledge text."
+"""
+
+def legacy_prompt(params, batch_size, avoid_questions=None):
+    subjects, topics, sub_topic, selected_pdfs, keywords, question_types, num_questions, difficulty_levels, language, question_source, year_range = params
+    return LEGACY_PROMPT.format(
+        subjects=", ".join(subjects) if subjects else "No specific subject selected",
+        topics=", ".join(topics) if topics else "No specific topic selected",
+        sub_topic=sub_topic if sub_topic else "No specific sub-topic selected",
+        keywords=keywords,
+        question_types=", ".join(question_types) if question_types else "All question types",
+        batch_size=batch_size,
+        difficulty_levels=", ".join(difficulty_levels) if difficulty_levels else "All difficulty levels",
+        language=language,
+        question_source=question_source,
+        year_from=year_range[0],
+        year_to=year_range[1],
+        pdfs=", ".join(selected_pdfs) if selected_pdfs else "All available PDFs",
+    ) + avoid_section(avoid_questions)
+
+def planned_batches(params, num_batches):
+    # (cell params, batch size) for the first num_batches batches of a job, as the pipeline would dispatch them
+    planner = BatchPlanner(params[5], params[8], pipeline.MAX_COMPLETION_TOKENS, pipeline.MAX_QUESTIONS_PER_BATCH, pipeline.MODEL_NAME)
+    num_questions = num_batches * planner.batch_capacity()
+    coverage = CoveragePlanner(params, num_questions, planner.cell_capacity())
+    batches = []
+    remaining = num_questions
+    while len(batches) < num_batches and remaining > 0:
+        cell, batch_size = coverage.next_batch(planner.next_batch_size(remaining))
+        if cell is None:
+            break
+        coverage.finish(cell.index, batch_size, batch_size)
+        remaining -= batch_size
+        batches.append((cell.params, batch_size))
+    return batches
+
+def main():
+    parser = argparse.ArgumentParser(description="Count prompt input tokens per question before and after the prefix split.")
+    parser.add_argument("--batches", type=int, default=500)
+    parser.add_argument("--subject", default="General Knowledge", choices=list(TOPICS))
+    parser.add_argument("--language", default="English", choices=["English", "Hindi", "Both"])
+    args = parser.parse_args()
+
+    params = pipeline.params_from_dict({
+        "subjects": [args.subject], "question_types": ["MCQ", "True/False"],
+        "difficulty_levels": ["Easy", "Medium", "Hard"], "language": args.language,
+    })
+    batches = planned_batches(params, args.batches)
+    questions = sum(batch_size for _, batch_size in batches)
+
+    model = pipeline.MODEL_NAME
+    before = sum(count_tokens(legacy_prompt(cell_params, batch_size), model) for cell_params, batch_size in batches)
+    counts = [prompt_token_counts(cell_params, batch_size, model=model) for cell_params, batch_size in batches]
+    prefix = counts[0]["prefix"]
+    parameters = sum(count["parameters"] for count in counts)
+    after = prefix * len(batches) + parameters
+    # Cached tokens are discounted, not free, and only once the shared prefix is long enough to be cached
+    cached = int(prefix * len(batches) * CACHED_INPUT_RATE) + parameters if prefix >= CACHE_MIN_TOKENS else after
+
+    print(f"{len(batches)} batches, {questions} questions ({args.subject}, {args.language}, {model})")
+    print(f"{'':<36}{'tokens':>10}{'per batch':>11}{'per question':>14}")
+    rows = [
+        ("before: single template", before),
+        ("after: prefix + parameters", after),
+        ("after: prefix billed as cached", cached),
+    ]
+    for label, tokens in rows:
+        print(f"{label:<36}{tokens:>10}{tokens / len(batches):>11.1f}{tokens / questions:>14.2f}")
+    print(f"Static prefix: {prefix} tokens, {prefix * len(batches) / after:.0%} of the input after the split")
+    print(f"The cached row counts cached tokens at {CACHED_INPUT_RATE:.0%} of the input price, in input-token equivalents.")
+    if prefix < CACHE_MIN_TOKENS:
+        print(f"The prefix is below the {CACHE_MIN_TOKENS}-token caching minimum, so on its own it is not cached and the cached row "
+              f"equals the one above; it is cached only when more shared text comes before the parameters.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+CACHE_PATH = os.path.join(".cache", "responses.sqlite3")
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+CACHE_TTL = 7 * 24 * 3600  # seconds
+
+def make_cache_key(prompt, assistant_id, model, seed):
+    payload = json.dumps([prompt, assistant_id, model, seed], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                csv_content TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self.conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        row = self.conn.execute("SELECT csv_content, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or now - row[1] > self.ttl:
+            if row is not None:
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.conn.commit()
+            self.misses += 1
+            return None
+        self.conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        self.conn.commit()
+        self.hits += 1
+        return row[0]
+
+    def put(self, key, csv_content):
+        now = time.time()
+        size = len(csv_content.encode("utf-8"))
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses (key, csv_content, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (key, csv_content, size, now, now)
+        )
+        self.evict(now)
+        self.conn.commit()
+
+    def evict(self, now):
+        self.conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until the cache fits again
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,67 @@
+import re
+from functools import lru_cache
+
+from subject_data import PDF_NAMES, SUBJECTS, TOPICS
+
+# subject_data.py compiled once per process into ordered lookups: subject -> topics -> PDFs, the
+# reverse lookups and a word index for search. Every session shares the one catalog, and option
+# lists keep the order subject_data.py gives them.
+
+WORD_PATTERN = re.compile(r"\w+")
+
+def words(text):
+    return WORD_PATTERN.findall(text.lower())
+
+class Catalog:
+    def __init__(self, subjects, topics, pdf_names):
+        self.subjects = list(dict.fromkeys(subjects))
+        self.topics = {subject: list(dict.fromkeys(topics.get(subject, []))) for subject in self.subjects}
+        self.pdfs = {}  # (subject, topic) -> [(sub_area, pdf)]; sub_area is None for topics without sub-areas
+        self.pdf_topics = {}  # pdf -> [(subject, topic)]
+        self.topic_subjects = {}  # topic -> [subject]
+        self.word_index = {}  # word -> {(subject, topic)}
+        self.order = {}  # (subject, topic) -> position, for results in catalog order
+        for subject in self.subjects:
+            for topic in self.topics[subject]:
+                key = (subject, topic)
+                # Topics either list their PDFs directly or group them by sub-area
+                entries = pdf_names.get(subject, {}).get(topic, [])
+                if isinstance(entries, dict):
+                    self.pdfs[key] = [(sub_area, pdf) for sub_area, pdfs in entries.items() for pdf in pdfs]
+                else:
+                    self.pdfs[key] = [(None, pdf) for pdf in entries]
+                self.order[key] = len(self.order)
+                self.topic_subjects.setdefault(topic, []).append(subject)
+                for sub_area, pdf in self.pdfs[key]:
+                    self.pdf_topics.setdefault(pdf, []).append(key)
+                for text in [subject, topic, *(sub_area or "" for sub_area, _ in self.pdfs[key]), *(pdf for _, pdf in self.pdfs[key])]:
+                    for word in words(text):
+                        self.word_index.setdefault(word, set()).add(key)
+
+    @lru_cache(maxsize=1024)
+    def topics_for(self, subjects):
+        # subjects is a tuple, so the sidebar's option lists are computed once per selection
+        return list(dict.fromkeys(topic for subject in subjects for topic in self.topics.get(subject, [])))
+
+    @lru_cache(maxsize=1024)
+    def pdfs_for(self, subjects, topics):
+        return list(dict.fromkeys(pdf for subject in subjects for topic in topics for _, pdf in self.pdfs.get((subject, topic), [])))
+
+    def subjects_for_topic(self, topic):
+        return self.topic_subjects.get(topic, [])
+
+    def topics_for_pdf(self, pdf):
+        return self.pdf_topics.get(pdf, [])
+
+    @lru_cache(maxsize=256)
+    def search(self, query):
+        # (subject, topic) pairs matching every word of the query, each as a word prefix
+        matches = None
+        for query_word in words(query):
+            found = set().union(*(keys for word, keys in self.word_index.items() if word.startswith(query_word)))
+            matches = found if matches is None else matches & found
+        return sorted(matches or [], key=self.order.get)
+
+@lru_cache(maxsize=1)
+def load_catalog():
+    return Catalog(SUBJECTS, TOPICS, PDF_NAMES)
@@ -0,0 +1,212 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import signal
+import sys
+
+from batching import BatchPlanner
+from cache import ResponseCache
+from client_pool import create_async_client
+from journal import JobJournal
+from metrics import MetricsRecorder
+from estimator import TokenBudget, estimate_job, format_duration
+from pdf_index import INDEX_PATH, PdfIndex
+from pipeline import (MAX_COMPLETION_TOKENS, MAX_PARALLEL_REQUESTS, MAX_QUESTIONS_PER_BATCH, MODEL_NAME,
+                      GenerationEvents, generate_questions_parallel_async, params_from_dict)
+from csv_stream import EXPECTED_COLUMNS, parse_csv_rows
+from scheduler import RateLimitScheduler
+
+# Headless batch runner: python cli.py jobs.yaml --output questions.jsonl
+#
+# A manifest is a JSON or YAML mapping with an optional "defaults" block and a "jobs" list.
+# Each job uses the create_sidebar parameter names (subjects, topics, question_types,
+# num_questions, language, year_range, ...) plus an optional "name".
+
+def load_manifest(path):
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    if path.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            sys.exit("PyYAML is required for YAML manifests (pip install pyyaml), or use JSON.")
+        manifest = yaml.safe_load(text)
+    else:
+        manifest = json.loads(text)
+
+    if isinstance(manifest, list):
+        manifest = {"jobs": manifest}
+    elif "jobs" not in manifest:
+        manifest = {"jobs": [manifest]}
+
+    defaults = manifest.get("defaults", {})
+    jobs = []
+    for i, job in enumerate(manifest["jobs"]):
+        values = {**defaults, **job}
+        name = values.pop("name", f"job-{i + 1}")
+        try:
+            jobs.append((name, params_from_dict(values)))
+        except ValueError as e:
+            raise ValueError(f"{name}: {e}") from None
+    return jobs
+
+class CsvOutput:
+    def __init__(self, f):
+        self.f = f
+        self.writer = csv.writer(f)
+        self.writer.writerow(EXPECTED_COLUMNS)
+
+    def write_rows(self, job_name, rows):
+        self.writer.writerows(rows)
+        self.f.flush()
+
+class JsonlOutput:
+    def __init__(self, f):
+        self.f = f
+
+    def write_rows(self, job_name, rows):
+        for row in rows:
+            self.f.write(json.dumps({"job": job_name, **dict(zip(EXPECTED_COLUMNS, row))}, ensure_ascii=False) + "\n")
+        self.f.flush()
+
+class CliEvents(GenerationEvents):
+    def __init__(self, job_name, num_questions, output, quiet=False):
+        self.job_name = job_name
+        self.num_questions = num_questions
+        self.output = output
+        self.quiet = quiet
+        self.completed_questions = 0
+
+    def log(self, message):
+        print(f"[{self.job_name}] {message}", file=sys.stderr, flush=True)
+
+    def error(self, message):
+        self.log(f"ERROR {message}")
+
+    def warning(self, message):
+        self.log(f"WARNING {message}")
+
+    def batch_done(self, index, question_count, csv_content):
+        if not csv_content:
+            self.log(f"WARNING Failed to generate a batch of {question_count} questions.")
+            return
+        rows = parse_csv_rows(csv_content)
+        self.output.write_rows(self.job_name, rows)
+        self.completed_questions += question_count
+        if not self.quiet:
+            self.log(f"Generated {self.completed_questions}/{self.num_questions} questions")
+
+def print_estimates(jobs, args):
+    journal = JobJournal()
+    totals = {"total_tokens": 0, "cost": 0.0}
+    for name, params in jobs:
+        history = journal.usage_history(params[5], params[8])
+        estimate = estimate_job(params, params[6], args.concurrency, history, MAX_COMPLETION_TOKENS, MAX_QUESTIONS_PER_BATCH, MODEL_NAME)
+        basis = f"from {len(history)} recent batches" if history else "no usage history yet"
+        print(f"[{name}] estimate ({basis}): {estimate['batches']} batches, {estimate['input_tokens']:,} input + {estimate['output_tokens']:,} output tokens, "
+              f"${estimate['cost']:.2f}, {format_duration(estimate['seconds'])} on its own", file=sys.stderr)
+        for key in totals:
+            totals[key] += estimate[key]
+    journal.close()
+    print(f"Estimated total: {totals['total_tokens']:,} tokens, ${totals['cost']:.2f}", file=sys.stderr)
+    if args.token_budget and totals["total_tokens"] > args.token_budget:
+        print(f"The token budget of {args.token_budget:,} covers about {args.token_budget / totals['total_tokens']:.0%} of this manifest.", file=sys.stderr)
+
+async def run_jobs(jobs, api_key, output, args):
+    # One scheduler for every job, so the whole manifest shares a single concurrency budget
+    scheduler = RateLimitScheduler(max_concurrency=args.concurrency)
+    cache = None if args.no_cache else ResponseCache()
+    journal = JobJournal()
+    metrics = MetricsRecorder(args.metrics_jsonl)
+    retriever = PdfIndex(args.index) if args.mode == "direct" else None
+    # Like the scheduler, the budget is shared by every job in the manifest
+    token_budget = TokenBudget(args.token_budget) if args.token_budget else None
+
+    # The first Ctrl-C keeps what has finished and cancels the rest; a second one aborts
+    finish_now = asyncio.Event()
+    loop = asyncio.get_running_loop()
+
+    def on_interrupt():
+        print("Finishing now: keeping finished batches and cancelling running ones. Press Ctrl-C again to abort.", file=sys.stderr)
+        finish_now.set()
+        loop.remove_signal_handler(signal.SIGINT)
+
+    try:
+        loop.add_signal_handler(signal.SIGINT, on_interrupt)
+    except NotImplementedError:
+        pass  # not on Windows; Ctrl-C aborts straight away there
+
+    # Resolved before any job starts, so two entries with the same parameters never share a journal job
+    job_ids = []
+    for _, params in jobs:
+        job_ids.append((None if args.no_resume else journal.find_incomplete_job(params, job_ids)) or journal.create_job(params))
+
+    async def run_job(name, params, job_id):
+        num_questions, language = params[6], params[8]
+        events = CliEvents(name, num_questions, output, args.quiet)
+        events.log(f"Job {job_id}: {num_questions} questions")
+        planner = BatchPlanner(params[5], language, MAX_COMPLETION_TOKENS, MAX_QUESTIONS_PER_BATCH, MODEL_NAME)
+        await generate_questions_parallel_async(params, api_key, num_questions, planner, language, events,
+                                                cache, args.replay_only, journal, job_id, scheduler, metrics, client, retriever, token_budget, finish_now)
+        return events.completed_questions >= num_questions
+
+    try:
+        # One client as well, so all jobs draw on the same connection pool
+        async with create_async_client(api_key, args.concurrency) as client:
+            results = await asyncio.gather(*(run_job(name, params, job_id) for (name, params), job_id in zip(jobs, job_ids)))
+    finally:
+        journal.close()
+        if retriever is not None:
+            retriever.close()
+        if args.metrics_file:
+            metrics.write_openmetrics(args.metrics_file)
+        if cache is not None:
+            print(f"Response cache: {cache.hits} hits, {cache.misses} misses", file=sys.stderr)
+            cache.close()
+    return all(results)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate questions from a job manifest without the Streamlit UI.")
+    parser.add_argument("manifest", help="JSON or YAML job manifest")
+    parser.add_argument("-o", "--output", required=True, help="output file (.csv or .jsonl)")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="output format (default: from the file extension)")
+    parser.add_argument("--concurrency", type=int, default=MAX_PARALLEL_REQUESTS, help="maximum runs in flight across all jobs")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"), help="defaults to $OPENAI_API_KEY")
+    parser.add_argument("--mode", choices=["assistants", "direct"], default="assistants",
+                        help="assistants: file search runs; direct: chat completions grounded on the local PDF index")
+    parser.add_argument("--index", default=INDEX_PATH, help="local PDF index for --mode direct (see pdf_index.py)")
+    parser.add_argument("--token-budget", type=int, default=0,
+                        help="stop sending batches and cancel running ones once this many tokens are used (0: no limit)")
+    parser.add_argument("--estimate-only", action="store_true", help="print the cost and time estimate and exit")
+    parser.add_argument("--no-cache", action="store_true", help="do not read or write the response cache")
+    parser.add_argument("--replay-only", action="store_true", help="serve batches from the cache only")
+    parser.add_argument("--no-resume", action="store_true", help="start fresh jobs instead of resuming interrupted ones")
+    parser.add_argument("--metrics-jsonl", help="append one JSON line of metrics per finished batch to this file")
+    parser.add_argument("--metrics-file", help="write OpenMetrics text here when the run ends (for a textfile collector)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only log errors and warnings")
+    args = parser.parse_args(argv)
+
+    if not args.api_key and not args.estimate_only:
+        parser.error("an API key is required (--api-key or OPENAI_API_KEY)")
+
+    if args.mode == "direct" and not os.path.exists(args.index):
+        parser.error(f"no PDF index at {args.index}; build one with: python pdf_index.py build path/to/pdfs")
+
+    try:
+        jobs = load_manifest(args.manifest)
+    except ValueError as e:
+        # Unknown job parameters and malformed JSON both end up here
+        parser.error(f"{args.manifest}: {e}")
+    print_estimates(jobs, args)
+    if args.estimate_only:
+        return 0
+    output_format = args.format or ("jsonl" if args.output.endswith(".jsonl") else "csv")
+    with open(args.output, "w", encoding="utf-8", newline="") as f:
+        output = JsonlOutput(f) if output_format == "jsonl" else CsvOutput(f)
+        ok = asyncio.run(run_jobs(jobs, args.api_key, output, args))
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import asyncio
+import hashlib
+import queue
+import threading
+import time
+
+import openai
+
+# One pooled client per API key for the whole process. Streamlit reruns re-execute main.py
+# but keep imported modules, so everything here survives reruns and is shared by sessions.
+
+KEEPALIVE_EXPIRY = 30  # seconds an idle pooled connection is kept open
+CONNECTION_HEADROOM = 10  # connections beyond the concurrency limit, for validation and cancels
+VALIDATION_TTL = 300  # seconds a validated key is trusted before models.list() is called again
+EVENT_DRAIN_INTERVAL = 0.05  # seconds between checks for events from the event loop thread
+POOLED_CONCURRENCY = 200  # pooled clients are sized for the app's largest concurrency; each job's scheduler applies its own
+
+def connection_limits(max_concurrency):
+    # The SDK's own httpx Limits class, whichever httpx package it was built against
+    size = max_concurrency + CONNECTION_HEADROOM
+    return type(openai.DEFAULT_CONNECTION_LIMITS)(max_connections=size, max_keepalive_connections=size, keepalive_expiry=KEEPALIVE_EXPIRY)
+
+def create_async_client(api_key, max_concurrency):
+    # Retries are owned by the scheduler so 429s reach the concurrency controller
+    client = openai.AsyncOpenAI(api_key=api_key, max_retries=0,
+                                http_client=openai.DefaultAsyncHttpxClient(limits=connection_limits(max_concurrency)))
+    # The SDK imports resource modules on first use, which stalls the event loop for a moment;
+    # pay that here instead of while the first wave of batches is in flight
+    client.beta.threads.runs, client.beta.threads.messages, client.chat.completions
+    return client
+
+def key_digest(api_key):
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+class ClientPool:
+    # Async clients are bound to the event loop they first ran on, so they all live on one
+    # long-lived loop in a daemon thread and every job is submitted to it
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loop = None
+        self.async_clients = {}
+        self.clients = {}
+        self.validated = {}
+
+    def event_loop(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, name="openai-client-pool", daemon=True).start()
+            return self.loop
+
+    def async_client(self, api_key):
+        # Only call from coroutines running on event_loop(). Connections open only as they are needed,
+        # so one client per key covers every concurrency setting and sessions sharing the key.
+        key = key_digest(api_key)
+        with self.lock:
+            if key not in self.async_clients:
+                self.async_clients[key] = create_async_client(api_key, POOLED_CONCURRENCY)
+            return self.async_clients[key]
+
+    def client(self, api_key):
+        key = key_digest(api_key)
+        with self.lock:
+            if key not in self.clients:
+                self.clients[key] = openai.OpenAI(api_key=api_key, http_client=openai.DefaultHttpxClient(
+                    limits=connection_limits(0)))
+            return self.clients[key]
+
+    def validate(self, api_key):
+        # Returns None for a usable key, otherwise the error message; both are cached for VALIDATION_TTL
+        key = key_digest(api_key)
+        cached = self.validated.get(key)
+        if cached is not None and time.monotonic() - cached[1] < VALIDATION_TTL:
+            return cached[0]
+        try:
+            self.client(api_key).models.list()
+            error = None
+        except openai.AuthenticationError as e:
+            error = str(e)
+        except Exception as e:
+            # Network trouble says nothing about the key, so it is not cached
+            return str(e)
+        self.validated[key] = (error, time.monotonic())
+        return error
+
+    def run(self, make_coroutine, events):
+        # Runs make_coroutine(events) on the pool's loop and blocks until it finishes. Calls made to
+        # events from the loop are replayed on this thread, so UI code never runs on the loop thread.
+        calls = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(make_coroutine(QueuedEvents(events, calls)), self.event_loop())
+        try:
+            while True:
+                try:
+                    name, args = calls.get(timeout=EVENT_DRAIN_INTERVAL)
+                except queue.Empty:
+                    if future.done():
+                        break
+                    continue
+                getattr(events, name)(*args)
+            while not calls.empty():
+                name, args = calls.get_nowait()
+                getattr(events, name)(*args)
+            return future.result()
+        except BaseException:
+            # A Streamlit stop or rerun interrupts this thread; take the job down with it
+            future.cancel()
+            raise
+
+class QueuedEvents:
+    # Stands in for a GenerationEvents object on the loop thread and forwards every call
+    def __init__(self, events, calls):
+        self.events = events
+        self.calls = calls
+
+    def __getattr__(self, name):
+        if not callable(getattr(self.events, name, None)):
+            raise AttributeError(name)
+        return lambda *args: self.calls.put((name, args))
+
+pool = ClientPool()
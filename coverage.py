@@ -0,0 +1,154 @@
+import json
+import random
+
+from catalog import load_catalog
+
+MAX_CELL_SOURCES = 6  # (source, style) units named in one prompt, so a cell's spec stays focused
+MAX_NOT_FOUND_BATCHES = 2  # "Not found" replies from one PDF/topic before all of its cells are dropped
+
+class CoverageCell:
+    def __init__(self, index, units, params):
+        self.index = index
+        self.units = units
+        self.params = params
+        self.quota = 0
+        self.delivered = 0
+        self.in_flight = 0
+        self.dropped = False
+
+    def remaining(self):
+        return self.quota - self.delivered - self.in_flight
+
+def unique_sources(cell):
+    return list(dict.fromkeys(source for source, _ in cell.units))
+
+def pdf_entries(subject, topic):
+    return list(load_catalog().pdfs.get((subject, topic), []))
+
+def zip_longest_groups(lists):
+    for depth in range(max((len(items) for items in lists), default=0)):
+        yield [items[depth] for items in lists if depth < len(items)]
+
+def plan_sources(params, rng):
+    subjects, topics, sub_topic, selected_pdfs = params[:4]
+    topic_groups = []
+    for subject in subjects:
+        subject_topics = [topic for topic in load_catalog().topics.get(subject, []) if not topics or topic in topics]
+        rng.shuffle(subject_topics)
+        groups = []
+        for topic in subject_topics:
+            entries = pdf_entries(subject, topic)
+            if selected_pdfs:
+                entries = [(sub_area, pdf) for sub_area, pdf in entries if pdf in selected_pdfs or sub_area in selected_pdfs]
+                if not entries:
+                    continue
+            rng.shuffle(entries)
+            groups.append([(subject, topic, sub_area, pdf) for sub_area, pdf in entries] or [(subject, topic, None, None)])
+        topic_groups.append(groups)
+
+    # Interleave subjects, then topics, then PDFs, so any prefix of the list is spread as widely as possible
+    ordered_groups = [group for round_groups in zip_longest_groups(topic_groups) for group in round_groups]
+    sources = []
+    for depth in range(max((len(group) for group in ordered_groups), default=0)):
+        sources.extend(group[depth] for group in ordered_groups if depth < len(group))
+    return sources
+
+def unique(items):
+    return list(dict.fromkeys(item for item in items if item))
+
+def cell_params(params, units):
+    # One prompt covers every (source, style) unit of its cell, so the spec lists all of their subjects, topics and PDFs
+    subjects, topics, sub_topic, selected_pdfs, keywords, question_types, num_questions, difficulty_levels, language, question_source, year_range = params
+    sources = [source for source, _ in units]
+    styles = [style for _, style in units]
+    return (
+        unique(source[0] for source in sources), unique(source[1] for source in sources),
+        sub_topic or ", ".join(unique(source[2] for source in sources)), unique(source[3] for source in sources), keywords,
+        unique(question_type for question_type, _ in styles) or question_types, num_questions,
+        unique(difficulty for _, difficulty in styles) or difficulty_levels, language, question_source, year_range
+    )
+
+class CoveragePlanner:
+    # Spreads a job over (subject, topic, PDF, question type, difficulty) units, grouped into cells of about one batch each
+    def __init__(self, params, num_questions, cell_questions):
+        rng = random.Random(json.dumps(list(params), ensure_ascii=False))
+        self.params = params
+        sources = plan_sources(params, rng)
+        styles = [(question_type, difficulty) for question_type in params[5] or [None] for difficulty in params[7] or [None]]
+        wanted = max(1, -(-num_questions // max(1, cell_questions)))
+
+        if sources:
+            # Each round gives every source one style, rotated so types and difficulties spread evenly
+            units = [(source, styles[(round_index + i) % len(styles)]) for round_index in range(len(styles)) for i, source in enumerate(sources)]
+            # Too few units for one batch-sized cell each: ask about them again rather than splitting cells into smaller batches
+            units = units * -(-wanted // len(units))
+            # Consecutive units are as far apart as the interleaving allows, so a cell mixes subjects, topics and styles
+            group = min(MAX_CELL_SOURCES, len(units) // wanted)
+            self.cells = [CoverageCell(i, units[start:start + group], cell_params(params, units[start:start + group]))
+                          for i, start in enumerate(range(0, len(units), group))]
+        else:
+            # Nothing concrete to split on: one cell with the job's own spec
+            self.cells = [CoverageCell(0, [(None, (None, None))], params)]
+
+        active = self.cells[:min(len(self.cells), wanted)]
+        for i, cell in enumerate(active):
+            cell.quota = num_questions // len(active) + (1 if i < num_questions % len(active) else 0)
+        self.next_reserve = len(active)
+        self.not_found = {}
+        self.dropped_sources = set()
+
+    def active_cells(self):
+        return [cell for cell in self.cells[:self.next_reserve] if not cell.dropped]
+
+    def next_batch(self, max_size):
+        candidates = [cell for cell in self.active_cells() if cell.remaining() > 0]
+        if not candidates or max_size <= 0:
+            return None, 0
+        cell = max(candidates, key=lambda c: (c.remaining(), -c.index))
+        size = min(max_size, cell.remaining())
+        cell.in_flight += size
+        return cell, size
+
+    def start(self, index, batch_size):
+        self.cells[index].in_flight += batch_size
+
+    def finish(self, index, batch_size, question_count, not_found=False):
+        cell = self.cells[index]
+        cell.in_flight -= batch_size
+        cell.delivered += question_count
+        if not_found:
+            # The single cell of a job with nothing to split on counts too, or it would be asked again forever
+            for source in unique_sources(cell):
+                self.not_found[source] = self.not_found.get(source, 0) + 1
+                if self.not_found[source] >= MAX_NOT_FOUND_BATCHES:
+                    self.drop_source(source)
+
+    def prune(self, cell):
+        # Drop the units of sources that keep answering "Not found"; the cell goes once none are left
+        cell.units = [unit for unit in cell.units if unit[0] not in self.dropped_sources]
+        if not cell.units:
+            cell.dropped = True
+        elif cell.units[0][0] is not None:
+            cell.params = cell_params(self.params, cell.units)
+        return not cell.dropped
+
+    def drop_source(self, source):
+        self.dropped_sources.add(source)
+        for cell in self.cells[:self.next_reserve]:
+            if not cell.dropped and any(unit[0] == source for unit in cell.units) and not self.prune(cell) and cell.remaining() > 0:
+                self.reassign(cell.remaining())
+
+    def reassign(self, questions):
+        # Move a dropped cell's unmet quota to the next unused cell, or spread it over the ones still active
+        while self.next_reserve < len(self.cells) and not self.prune(self.cells[self.next_reserve]):
+            self.next_reserve += 1
+        if self.next_reserve < len(self.cells):
+            self.cells[self.next_reserve].quota = questions
+            self.next_reserve += 1
+            return
+        active = self.active_cells()
+        for _ in range(questions if active else 0):
+            min(active, key=lambda c: (c.quota, c.index)).quota += 1
+
+    def dropped_labels(self):
+        return sorted({" / ".join(part for part in source if part) if source else "this job" for source in self.dropped_sources})
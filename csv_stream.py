@@ -0,0 +1,152 @@
+import csv
+import io
+
+EXPECTED_COLUMNS = [
+    "Subject", "Topic", "Sub-Topic", "Question Type", "Question Text (English)", "Question Text (Hindi)",
+    "Option A (English)", "Option B (English)", "Option C (English)", "Option D (English)",
+    "Option A (Hindi)", "Option B (Hindi)", "Option C (Hindi)", "Option D (Hindi)",
+    "Correct Answer (English)", "Correct Answer (Hindi)", "Explanation (English)", "Explanation (Hindi)",
+    "Difficulty Level", "Language", "Source PDF Name", "Source Page Number", "Original Question Number", "Year of Original Question"
+]
+
+MAX_RECORD_LINES = 200  # a quoted field still open after this many lines is treated as malformed
+NOT_FOUND_TEXT = "Not found in knowledge text"
+
+def is_header(fields):
+    return "Subject" in fields and "Topic" in fields
+
+def readable(record):
+    try:
+        for _ in csv.reader([record]):
+            pass
+    except csv.Error:
+        return False
+    return True
+
+class CsvStreamParser:
+    # Incremental RFC 4180 parser that appends straight into per-column lists.
+    # Complete records are found by quote parity and handed to the C csv reader in bulk.
+    def __init__(self, columns=EXPECTED_COLUMNS):
+        self.columns = list(columns)
+        self.data = {col: [] for col in self.columns}
+        self.mapping = list(range(len(self.columns)))
+        self.row_count = 0
+        self.header_seen = False
+        self.not_found_count = 0
+        self.buffer = ""
+        self.record_lines = []
+        self.quote_count = 0
+
+    def feed(self, chunk):
+        rows_before = self.row_count
+        lines = (self.buffer + chunk).split('\n')
+        self.buffer = lines.pop()
+        records = []
+        for line in lines:
+            self.push_line(line, records)
+        self.add_records(records)
+        return self.row_count - rows_before
+
+    def close(self):
+        rows_before = self.row_count
+        records = []
+        if self.buffer:
+            self.push_line(self.buffer, records)
+            self.buffer = ""
+        self.add_records(records)
+        while self.record_lines:
+            # Unterminated quote at the end of the response: keep what can be read
+            records = ['\n'.join(self.record_lines) + '"']
+            if readable(records[0]):
+                self.record_lines = []
+                self.quote_count = 0
+            else:
+                records = []
+                self.rescan(records)
+            self.add_records(records)
+        return self.row_count - rows_before
+
+    def push_line(self, line, records):
+        line = line.rstrip('\r')
+        if not self.record_lines and (not line.strip() or line.lstrip().startswith("```")):
+            return
+        self.record_lines.append(line)
+        self.quote_count += line.count('"')
+        if self.quote_count % 2 == 0:
+            records.append('\n'.join(self.record_lines))
+            self.record_lines = []
+            self.quote_count = 0
+        elif len(self.record_lines) > MAX_RECORD_LINES:
+            # A stray quote opened a field that never closes
+            self.rescan(records)
+
+    def rescan(self, records):
+        # Reads the first line of the stuck record literally and pushes the lines after it again
+        stuck_lines = self.record_lines
+        self.record_lines = []
+        self.quote_count = 0
+        self.add_records(records)
+        records.clear()
+        # Reading those records may have left lines of an unreadable one open, and they come first
+        stuck_lines = self.record_lines + stuck_lines
+        self.record_lines = []
+        self.quote_count = 0
+        self.add_fields(next(csv.reader([stuck_lines[0]], quoting=csv.QUOTE_NONE)))
+        for stuck_line in stuck_lines[1:]:
+            self.push_line(stuck_line, records)
+
+    def add_records(self, records):
+        try:
+            rows = list(csv.reader(records))
+        except csv.Error:
+            # A stray quote in an unquoted field (5" tall) joined the lines after it into a record csv cannot read
+            self.add_records_one_by_one(records)
+            return
+        for fields in rows:
+            self.add_fields(fields)
+
+    def add_records_one_by_one(self, records):
+        for i, record in enumerate(records):
+            try:
+                rows = list(csv.reader([record]))
+            except csv.Error:
+                # The unreadable record and everything after it go back through push_line, ahead of any open record
+                self.record_lines = '\n'.join(records[i:]).split('\n') + self.record_lines
+                rescanned = []
+                self.rescan(rescanned)
+                self.add_records(rescanned)
+                return
+            for fields in rows:
+                self.add_fields(fields)
+
+    def add_fields(self, fields):
+        fields = [field.strip() for field in fields]
+        if not any(fields):
+            return
+        if is_header(fields):
+            if not self.header_seen:
+                self.header_seen = True
+                self.mapping = [fields.index(col) if col in fields else i for i, col in enumerate(self.columns)]
+            return
+        if len(fields) == 1 and NOT_FOUND_TEXT in fields[0]:
+            self.not_found_count += 1
+            return
+        for col, position in zip(self.columns, self.mapping):
+            self.data[col].append(fields[position] if position < len(fields) else 'N/A')
+        self.row_count += 1
+
+    def rows(self, start=0):
+        return zip(*(values[start:] for values in self.data.values()))
+
+def parse_csv_rows(csv_content):
+    parser = CsvStreamParser()
+    parser.feed(csv_content)
+    parser.close()
+    return [list(row) for row in parser.rows()]
+
+def rows_to_csv(rows, columns=EXPECTED_COLUMNS):
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerow(columns)
+    writer.writerows(rows)
+    return out.getvalue()
@@ -0,0 +1,91 @@
+import re
+import zlib
+
+import numpy as np
+
+SIMILARITY_THRESHOLD = 0.7  # estimated Jaccard similarity at which two questions count as the same
+NUM_PERMUTATIONS = 64
+NUM_BANDS = 16  # LSH bands of NUM_PERMUTATIONS // NUM_BANDS rows each
+SHINGLE_SIZE = 2  # words
+
+WORD_PATTERN = re.compile(r"\w+")
+
+def normalize_question(text):
+    if not text or text == "N/A":
+        return ""
+    return " ".join(WORD_PATTERN.findall(text.lower()))
+
+def shingle_hashes(text):
+    words = text.split()
+    if len(words) < SHINGLE_SIZE:
+        shingles = words
+    else:
+        shingles = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+    return [zlib.crc32(shingle.encode("utf-8")) for shingle in set(shingles)]
+
+class NearDuplicateIndex:
+    # Incremental MinHash/LSH index over normalized question texts
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, num_perm=NUM_PERMUTATIONS, bands=NUM_BANDS, seed=1):
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hashing: (a * x + b) mod 2**64, keeping the high 32 bits
+        self.a = rng.integers(1, 2 ** 63, size=(num_perm, 1), dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2 ** 63, size=(num_perm, 1), dtype=np.uint64)
+        self.threshold = threshold
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+        self.buckets = [{} for _ in range(bands)]
+        self.signatures = []
+        self.texts = []
+        self.duplicate_hits = []
+        self.duplicate_count = 0
+
+    def signatures_for(self, texts):
+        hashes = [shingle_hashes(text) for text in texts]
+        lengths = np.array([len(h) for h in hashes])
+        flat = np.fromiter((x for h in hashes for x in h), dtype=np.uint64, count=int(lengths.sum()))
+        permuted = (self.a * flat + self.b) >> np.uint64(32)
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        # One reduceat computes the minimum of every permutation over every text's shingles
+        return np.minimum.reduceat(permuted, offsets, axis=1).T
+
+    def band_keys(self, signature):
+        r = self.rows_per_band
+        return [signature[i * r:(i + 1) * r].tobytes() for i in range(self.bands)]
+
+    def find(self, signature, keys):
+        candidates = set()
+        for bucket, key in zip(self.buckets, keys):
+            candidates.update(bucket.get(key, ()))
+        for candidate in candidates:
+            if np.mean(self.signatures[candidate] == signature) >= self.threshold:
+                return candidate
+        return None
+
+    def add_many(self, texts):
+        normalized = [normalize_question(text) for text in texts]
+        unique = [True] * len(texts)
+        indexed = [i for i, text in enumerate(normalized) if text]
+        if not indexed:
+            return unique
+
+        signatures = self.signatures_for([normalized[i] for i in indexed])
+        for i, signature in zip(indexed, signatures):
+            keys = self.band_keys(signature)
+            match = self.find(signature, keys)
+            if match is not None:
+                unique[i] = False
+                self.duplicate_hits[match] += 1
+                self.duplicate_count += 1
+                continue
+            position = len(self.signatures)
+            self.signatures.append(signature)
+            self.texts.append(texts[i])
+            self.duplicate_hits.append(0)
+            for bucket, key in zip(self.buckets, keys):
+                bucket.setdefault(key, []).append(position)
+        return unique
+
+    def avoid_list(self, limit):
+        # The questions the model keeps coming back to first, then the most recent ones
+        order = sorted(range(len(self.texts)), key=lambda i: (-self.duplicate_hits[i], -i))
+        return [self.texts[i] for i in order[:limit]]
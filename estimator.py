@@ -0,0 +1,104 @@
+import heapq
+
+from batching import BatchPlanner, count_tokens
+from coverage import CoveragePlanner
+from prompts import build_prompt
+
+# Pre-flight estimate of what a job will cost and how long it will take, and the budget that
+# stops a job once it has used the tokens it was allowed.
+
+# USD per million tokens: input, output
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+RETRIEVAL_TOKENS = 2000  # file search results added to a run's input, until history says otherwise
+RUN_OVERHEAD_SECONDS = 8  # thread, message, file search and queueing before the first token
+OUTPUT_TOKENS_PER_SECOND = 60  # generation speed assumed before history exists
+
+def plan_batches(params, num_questions, planner):
+    # The batches a job is sent as: the coverage cells, each split by the batch planner, as dispatch() does it
+    coverage = CoveragePlanner(params, num_questions, planner.cell_capacity())
+    batches = []
+    remaining = num_questions
+    while remaining > 0:
+        cell, batch_size = coverage.next_batch(planner.next_batch_size(remaining))
+        if cell is None:
+            break
+        batches.append((cell, batch_size))
+        remaining -= batch_size
+    return batches
+
+def schedule_seconds(batch_seconds, max_concurrency):
+    # Wall time when every batch starts as soon as one of max_concurrency slots is free
+    slots = [0.0] * min(max_concurrency, len(batch_seconds))
+    for seconds in batch_seconds:
+        heapq.heappush(slots, heapq.heappop(slots) + seconds)
+    return max(slots, default=0.0)
+
+def estimate_job(params, num_questions, max_concurrency, history, max_completion_tokens, max_batch_size, model):
+    # history is JobJournal.usage_history() for the job's question types and language: recent batches
+    # with their real usage and wall time
+    planner = BatchPlanner(params[5], params[8], max_completion_tokens, max_batch_size, model)
+    history_questions = sum(batch["batch_size"] for batch in history)
+    planner.observe(sum(batch["completion_tokens"] for batch in history), history_questions)
+
+    batches = plan_batches(params, num_questions, planner)
+    output_tokens = int(sum(size for _, size in batches) * planner.tokens_per_question())
+    if history:
+        input_tokens = int(len(batches) * sum(batch["prompt_tokens"] for batch in history) / len(history))
+        seconds_per_question = sum(batch["seconds"] for batch in history) / history_questions
+        batch_seconds = [seconds_per_question * size for _, size in batches]
+    else:
+        input_tokens = sum(count_tokens(build_prompt(cell.params, size), model) + RETRIEVAL_TOKENS for cell, size in batches)
+        batch_seconds = [RUN_OVERHEAD_SECONDS + size * planner.tokens_per_question() / OUTPUT_TOKENS_PER_SECOND for _, size in batches]
+
+    input_price, output_price = MODEL_PRICES.get(model, MODEL_PRICES["gpt-4o"])
+    return {
+        "batches": len(batches),
+        "batch_size": round(num_questions / len(batches)) if batches else 0,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": input_tokens + output_tokens,
+        "cost": (input_tokens * input_price + output_tokens * output_price) / 1_000_000,
+        "seconds": schedule_seconds(batch_seconds, max_concurrency),
+        "history_batches": len(history),
+    }
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m" if hours else f"{minutes}m {seconds:02d}s"
+
+class TokenBudget:
+    # A hard cap on the tokens a job may use. Batches reserve their estimate before they are sent,
+    # so new batches stop once spent plus in-flight estimates would pass the limit.
+    def __init__(self, limit):
+        self.limit = limit
+        self.spent = 0
+        self.reserved = 0
+        self.prompt_tokens = 0
+        self.batches = 0
+
+    def input_estimate(self, prior):
+        # Real prompt usage includes retrieved context, so it replaces the prior once there is some
+        return self.prompt_tokens / self.batches if self.batches else prior
+
+    def reserve(self, tokens):
+        if self.spent + self.reserved + tokens > self.limit:
+            return False
+        self.reserved += tokens
+        return True
+
+    def settle(self, reserved, usages, unreported=0):
+        # Swaps a finished batch's reservation for what all of its attempts used: failed retries and
+        # hedged duplicates included. unreported covers attempts cancelled before they reported usage
+        self.reserved -= reserved
+        self.spent += unreported
+        for usage in usages:
+            self.spent += usage.prompt_tokens + usage.completion_tokens
+            self.prompt_tokens += usage.prompt_tokens
+            self.batches += 1
+
+    def exhausted(self):
+        return self.spent >= self.limit
@@ -0,0 +1,17 @@
+# Kept apart from pipeline.py so front ends can subclass it without importing the OpenAI SDK
+
+class GenerationEvents:
+    # Hooks the pipeline reports through; front ends override the ones they care about
+    def error(self, message):
+        pass
+
+    def warning(self, message):
+        pass
+
+    def batch_line(self, index, line):
+        pass
+
+    # csv_content holds only the questions kept after de-duplication, question_count of them;
+    # on failure it is None and question_count is the size of the lost batch
+    def batch_done(self, index, question_count, csv_content):
+        pass
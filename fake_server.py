@@ -0,0 +1,471 @@
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Stand-in for the Assistants and chat completions endpoints used by main.py, with OpenAI-style rate limits.
+# Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8765/v1
+
+CSV_HEADER = '"Subject","Topic","Sub-Topic","Question Type","Question Text (English)","Question Text (Hindi)","Option A (English)","Option B (English)","Option C (English)","Option D (English)","Option A (Hindi)","Option B (Hindi)","Option C (Hindi)","Option D (Hindi)","Correct Answer (English)","Correct Answer (Hindi)","Explanation (English)","Explanation (Hindi)","Difficulty Level","Language","Source PDF Name","Source Page Number","Original Question Number","Year of Original Question"'
+NUMBER_OF_QUESTIONS = re.compile(r"Number of Questions:\**\s*(\d+)")
+
+LATENCY_DISTRIBUTIONS = ["fixed", "exponential", "lognormal"]
+INJECTED_RETRY_AFTER = 0.2  # seconds; retry-after sent with randomly injected 429s
+FILLER_WORDS = "the constitution of india provides for a parliamentary form of government which is federal in structure".split()
+
+THREAD_PATH = re.compile(r"^/v1/threads/([^/]+)/(messages|runs)$")
+RUN_PATH = re.compile(r"^/v1/threads/([^/]+)/runs/([^/]+)(/cancel)?$")
+
+def new_id(prefix):
+    return f"{prefix}_{uuid.uuid4().hex[:24]}"
+
+def fake_csv_row(index, explanation_words=0):
+    filler = " ".join(FILLER_WORDS[i % len(FILLER_WORDS)] for i in range(explanation_words))
+    return (f'"General Knowledge","Polity","","MCQ","Sample question {index}?","","Option A","Option B","Option C","Option D",'
+            f'"","","","","Option A","","Explanation for sample question {index}. {filler}","","Medium","English","PB-Polity.pdf","{index % 300 + 1}","{index}","2020"')
+
+class Window:
+    # Server-side token bucket that refills its capacity once per minute
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.available = float(per_minute) if per_minute else 0.0
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        if self.capacity:
+            self.available = min(self.capacity, self.available + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def try_take(self, amount):
+        self.refill()
+        if not self.capacity:
+            return True
+        if self.available >= amount:
+            self.available -= amount
+            return True
+        return False
+
+    def seconds_until(self, amount):
+        if not self.capacity:
+            return 0.0
+        return max(0.0, (min(amount, self.capacity) - self.available) * 60 / self.capacity)
+
+    def headers(self, kind):
+        if not self.capacity:
+            return {}
+        return {
+            f"x-ratelimit-limit-{kind}": str(self.capacity),
+            f"x-ratelimit-remaining-{kind}": str(int(self.available)),
+            f"x-ratelimit-reset-{kind}": f"{(self.capacity - self.available) * 60 / self.capacity:.3f}s",
+        }
+
+class FakeHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # the default backlog of 5 stalls bursts of new client connections for a second
+
+class FakeAssistantsServer:
+    def __init__(self, host="127.0.0.1", port=0, requests_per_minute=0, tokens_per_minute=0,
+                 tokens_per_question=500, run_seconds=2.0, latency="fixed", latency_sigma=0.5, request_latency=0.0,
+                 failure_rate=0.0, expiry_rate=0.0, rate_limit_rate=0.0, explanation_words=0, seconds_per_question=0.0, seed=None):
+        if latency not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"latency must be one of {LATENCY_DISTRIBUTIONS}")
+        self.requests = Window(requests_per_minute)
+        self.tokens = Window(tokens_per_minute)
+        self.tokens_per_question = tokens_per_question
+        self.run_seconds = run_seconds  # mean run duration, plus seconds_per_question for each question asked for
+        self.seconds_per_question = seconds_per_question
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.request_latency = request_latency
+        self.failure_rate = failure_rate
+        self.expiry_rate = expiry_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.explanation_words = explanation_words
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.threads = {}
+        self.runs = {}
+        self.question_count = 0
+        self.stats = {"requests": 0, "rate_limited": 0, "runs": 0, "completions": 0, "failed": 0, "expired": 0, "cancelled": 0}
+        self.httpd = FakeHTTPServer((host, port), self.handler_class())
+        self.serve_thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.serve_thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.serve_thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # Rate limiting
+
+    def admit(self, tokens):
+        with self.lock:
+            self.stats["requests"] += 1
+            if self.rate_limit_rate and self.rng.random() < self.rate_limit_rate:
+                self.stats["rate_limited"] += 1
+                return False, INJECTED_RETRY_AFTER, "requests"
+            if not self.requests.try_take(1):
+                self.stats["rate_limited"] += 1
+                return False, self.requests.seconds_until(1), "requests"
+            if tokens and not self.tokens.try_take(tokens):
+                self.requests.available += 1
+                self.stats["rate_limited"] += 1
+                return False, self.tokens.seconds_until(tokens), "tokens"
+            return True, 0.0, None
+
+    def rate_limit_headers(self):
+        with self.lock:
+            self.requests.refill()
+            self.tokens.refill()
+            return {**self.requests.headers("requests"), **self.tokens.headers("tokens")}
+
+    # Simulated behaviour
+
+    def sample_run_seconds(self, batch_size):
+        mean = self.run_seconds + self.seconds_per_question * batch_size
+        if self.latency == "exponential":
+            return self.rng.expovariate(1 / mean) if mean else 0.0
+        if self.latency == "lognormal":
+            # Parameterised so the mean stays put whatever the spread
+            return self.rng.lognormvariate(math.log(max(mean, 1e-9)) - self.latency_sigma ** 2 / 2, self.latency_sigma)
+        return mean
+
+    def sample_outcome(self):
+        draw = self.rng.random()
+        if draw < self.failure_rate:
+            return "failed"
+        if draw < self.failure_rate + self.expiry_rate:
+            return "expired"
+        return "completed"
+
+    def delay_response(self):
+        if self.request_latency:
+            time.sleep(self.request_latency)
+
+    # Resources
+
+    def create_thread(self):
+        thread = {"id": new_id("thread"), "object": "thread", "created_at": int(time.time()), "metadata": {}}
+        with self.lock:
+            self.threads[thread["id"]] = {"thread": thread, "messages": []}
+        return thread
+
+    def add_message(self, thread_id, role, content):
+        message = {
+            "id": new_id("msg"), "object": "thread.message", "created_at": int(time.time()),
+            "thread_id": thread_id, "role": role, "status": "completed",
+            "content": [{"type": "text", "text": {"value": content, "annotations": []}}],
+        }
+        with self.lock:
+            self.threads[thread_id]["messages"].append(message)
+        return message
+
+    def batch_size(self, thread_id):
+        with self.lock:
+            prompts = [m["content"][0]["text"]["value"] for m in self.threads[thread_id]["messages"] if m["role"] == "user"]
+        match = NUMBER_OF_QUESTIONS.search(prompts[-1]) if prompts else None
+        return int(match.group(1)) if match else 10
+
+    def chat_batch_size(self, body):
+        prompts = [m.get("content") or "" for m in body.get("messages") or [] if m.get("role") == "user"]
+        match = NUMBER_OF_QUESTIONS.search(prompts[-1]) if prompts else None
+        return int(match.group(1)) if match else 10
+
+    def create_completion(self, body):
+        # Direct mode: the whole answer comes from one request, so failures surface as 500s
+        batch_size = self.chat_batch_size(body)
+        with self.lock:
+            first = self.question_count
+            self.question_count += batch_size
+            seconds = self.sample_run_seconds(batch_size)
+            outcome = self.sample_outcome()
+            self.stats["completions"] += 1
+            if outcome != "completed":
+                self.stats[outcome] += 1
+        rows = [fake_csv_row(i, self.explanation_words) for i in range(first, first + batch_size)]
+        completion_tokens = self.tokens_per_question * batch_size
+        return {
+            "id": new_id("chatcmpl"), "created": int(time.time()), "model": body.get("model"), "seconds": seconds,
+            "outcome": outcome, "lines": [CSV_HEADER] + rows,
+            "usage": {"prompt_tokens": 1000, "completion_tokens": completion_tokens, "total_tokens": 1000 + completion_tokens},
+        }
+
+    def create_run(self, thread_id, body):
+        batch_size = self.batch_size(thread_id)
+        with self.lock:
+            # Questions are numbered across the whole server so batches do not repeat each other
+            first = self.question_count
+            self.question_count += batch_size
+            seconds = self.sample_run_seconds(batch_size)
+            outcome = self.sample_outcome()
+        rows = [fake_csv_row(i, self.explanation_words) for i in range(first, first + batch_size)]
+        run = {
+            "id": new_id("run"), "object": "thread.run", "created_at": int(time.time()),
+            "thread_id": thread_id, "assistant_id": body.get("assistant_id"), "model": body.get("model"),
+            "status": "queued", "last_error": None, "usage": None,
+        }
+        with self.lock:
+            self.stats["runs"] += 1
+            self.runs[run["id"]] = {"run": run, "started": time.monotonic(), "seconds": seconds, "outcome": outcome, "rows": rows, "finished": False}
+        return run
+
+    def run_output(self, run_id):
+        entry = self.runs[run_id]
+        return CSV_HEADER + "\n" + "\n".join(entry["rows"])
+
+    def finish_run(self, run_id, status="completed"):
+        with self.lock:
+            entry = self.runs[run_id]
+            if entry["finished"]:
+                return entry["run"]
+            entry["finished"] = True
+            run = entry["run"]
+            run["status"] = status
+            if status in self.stats:
+                self.stats[status] += 1
+            if status == "failed":
+                run["last_error"] = {"code": "server_error", "message": "Sorry, something went wrong."}
+            if status == "completed":
+                completion_tokens = self.tokens_per_question * len(entry["rows"])
+                run["usage"] = {"prompt_tokens": 1000, "completion_tokens": completion_tokens, "total_tokens": 1000 + completion_tokens}
+            else:
+                # Runs that end early are still billed for the prompt they read
+                run["usage"] = {"prompt_tokens": 1000, "completion_tokens": 0, "total_tokens": 1000}
+        if status == "completed":
+            self.add_message(run["thread_id"], "assistant", self.run_output(run_id))
+        return run
+
+    def retrieve_run(self, run_id):
+        entry = self.runs[run_id]
+        if not entry["finished"]:
+            elapsed = time.monotonic() - entry["started"]
+            if elapsed >= entry["seconds"]:
+                return self.finish_run(run_id, entry["outcome"])
+            entry["run"]["status"] = "in_progress"
+        return entry["run"]
+
+    def cancel_run(self, run_id):
+        return self.finish_run(run_id, status="cancelled")
+
+    def handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def read_body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+            def send_json(self, status, payload, extra_headers=None):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in {**server.rate_limit_headers(), **(extra_headers or {})}.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up on the request, e.g. a cancelled batch
+                    self.close_connection = True
+
+            def send_event(self, event, data):
+                payload = data if isinstance(data, str) else json.dumps(data)
+                chunk = f"event: {event}\ndata: {payload}\n\n".encode()
+                self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                self.wfile.flush()
+
+            def stream_run(self, run):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                for name, value in server.rate_limit_headers().items():
+                    self.send_header(name, value)
+                self.end_headers()
+
+                self.send_event("thread.run.created", run)
+                run["status"] = "in_progress"
+                self.send_event("thread.run.in_progress", run)
+                entry = server.runs[run["id"]]
+                message_id = new_id("msg")
+                lines = [CSV_HEADER] + entry["rows"]
+                delay = entry["seconds"] / len(lines)
+                if entry["outcome"] != "completed":
+                    # Runs that fail or expire stop partway through their output
+                    lines = lines[:len(lines) // 2]
+                try:
+                    for line in lines:
+                        time.sleep(delay)
+                        self.send_event("thread.message.delta", {
+                            "id": message_id, "object": "thread.message.delta",
+                            "delta": {"content": [{"index": 0, "type": "text", "text": {"value": line + "\n"}}]},
+                        })
+                        if entry["finished"]:
+                            break
+                    final = server.finish_run(run["id"], entry["outcome"])
+                    self.send_event(f"thread.run.{final['status']}", final)
+                    self.send_event("done", "[DONE]")
+                    self.wfile.write(b"0\r\n\r\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client went away; the run keeps going and can still be retrieved
+                    self.close_connection = True
+
+            def chat_completion(self, body):
+                completion = server.create_completion(body)
+                if completion["outcome"] != "completed":
+                    time.sleep(completion["seconds"] / 2)
+                    return self.send_json(500, {"error": {"message": "The server had an error while processing your request.",
+                                                          "type": "server_error", "param": None, "code": None}})
+                base = {"id": completion["id"], "object": "chat.completion.chunk", "created": completion["created"], "model": completion["model"]}
+                if not body.get("stream"):
+                    time.sleep(completion["seconds"])
+                    return self.send_json(200, {**base, "object": "chat.completion", "usage": completion["usage"], "choices": [{
+                        "index": 0, "message": {"role": "assistant", "content": "\n".join(completion["lines"])}, "finish_reason": "stop"}]})
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                for name, value in server.rate_limit_headers().items():
+                    self.send_header(name, value)
+                self.end_headers()
+                delay = completion["seconds"] / len(completion["lines"])
+                try:
+                    for line in completion["lines"]:
+                        time.sleep(delay)
+                        self.send_data({**base, "choices": [{"index": 0, "delta": {"content": line + "\n"}, "finish_reason": None}]})
+                    self.send_data({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+                    if (body.get("stream_options") or {}).get("include_usage"):
+                        self.send_data({**base, "choices": [], "usage": completion["usage"]})
+                    self.send_data("[DONE]")
+                    self.wfile.write(b"0\r\n\r\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+
+            def send_data(self, data):
+                payload = data if isinstance(data, str) else json.dumps(data)
+                chunk = f"data: {payload}\n\n".encode()
+                self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                self.wfile.flush()
+
+            def reject(self, retry_after, kind):
+                retry_after = max(retry_after, 0.001)
+                self.send_json(429, {"error": {
+                    "message": f"Rate limit reached for {kind}. Please try again in {retry_after:.3f}s.",
+                    "type": kind, "param": None, "code": "rate_limit_exceeded",
+                }}, {"retry-after-ms": str(int(retry_after * 1000)), "retry-after": str(int(retry_after) + 1)})
+
+            def not_found(self):
+                self.send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error", "param": None, "code": None}})
+
+            def do_GET(self):
+                server.delay_response()
+                allowed, retry_after, kind = server.admit(0)
+                if not allowed:
+                    return self.reject(retry_after, kind)
+                if self.path.startswith("/v1/models"):
+                    return self.send_json(200, {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model", "created": 0, "owned_by": "fake"}]})
+                match = THREAD_PATH.match(self.path.split("?")[0])
+                if match and match.group(2) == "messages" and match.group(1) in server.threads:
+                    messages = list(reversed(server.threads[match.group(1)]["messages"]))
+                    return self.send_json(200, {"object": "list", "data": messages, "has_more": False})
+                match = RUN_PATH.match(self.path)
+                if match and match.group(2) in server.runs:
+                    return self.send_json(200, server.retrieve_run(match.group(2)))
+                self.not_found()
+
+            def do_POST(self):
+                body = self.read_body()
+                server.delay_response()
+                path = self.path.split("?")[0]
+                thread_match = THREAD_PATH.match(path)
+                is_run_create = bool(thread_match and thread_match.group(2) == "runs")
+                tokens = 0
+                if is_run_create and thread_match.group(1) in server.threads:
+                    tokens = server.tokens_per_question * server.batch_size(thread_match.group(1))
+                elif path == "/v1/chat/completions":
+                    tokens = server.tokens_per_question * server.chat_batch_size(body)
+                allowed, retry_after, kind = server.admit(tokens)
+                if not allowed:
+                    return self.reject(retry_after, kind)
+
+                if path == "/v1/chat/completions":
+                    return self.chat_completion(body)
+                if path == "/v1/threads":
+                    thread = server.create_thread()
+                    for message in body.get("messages") or []:
+                        server.add_message(thread["id"], message.get("role", "user"), message.get("content", ""))
+                    return self.send_json(200, thread)
+                if thread_match and thread_match.group(1) in server.threads:
+                    thread_id = thread_match.group(1)
+                    if thread_match.group(2) == "messages":
+                        return self.send_json(200, server.add_message(thread_id, body.get("role", "user"), body.get("content", "")))
+                    run = server.create_run(thread_id, body)
+                    if body.get("stream"):
+                        return self.stream_run(run)
+                    return self.send_json(200, run)
+                match = RUN_PATH.match(path)
+                if match and match.group(3) and match.group(2) in server.runs:
+                    return self.send_json(200, server.cancel_run(match.group(2)))
+                self.not_found()
+
+        return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local fake Assistants API server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rpm", type=int, default=0, help="requests per minute (0 = unlimited)")
+    parser.add_argument("--tpm", type=int, default=0, help="tokens per minute (0 = unlimited)")
+    parser.add_argument("--tokens-per-question", type=int, default=500)
+    parser.add_argument("--run-seconds", type=float, default=2.0, help="mean run duration")
+    parser.add_argument("--latency", choices=LATENCY_DISTRIBUTIONS, default="fixed", help="run duration distribution")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="spread of the lognormal distribution")
+    parser.add_argument("--request-latency", type=float, default=0.0, help="seconds added to every HTTP response")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of runs that end failed")
+    parser.add_argument("--expiry-rate", type=float, default=0.0, help="fraction of runs that end expired")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests answered with a random 429")
+    parser.add_argument("--explanation-words", type=int, default=0, help="filler words per explanation, to grow the CSV payload")
+    parser.add_argument("--seconds-per-question", type=float, default=0.0, help="run duration added per question asked for")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    server = FakeAssistantsServer(args.host, args.port, args.rpm, args.tpm, args.tokens_per_question, args.run_seconds,
+                                  args.latency, args.latency_sigma, args.request_latency, args.failure_rate, args.expiry_rate,
+                                  args.rate_limit_rate, args.explanation_words, args.seconds_per_question, args.seed)
+    print(f"Fake Assistants API listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+if __name__ == "__main__":
+    main()
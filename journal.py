@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+JOURNAL_PATH = os.path.join(".cache", "jobs.sqlite3")
+
+def params_fingerprint(params):
+    payload = json.dumps(list(params), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class JobJournal:
+    def __init__(self, path=JOURNAL_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                params TEXT NOT NULL,
+                num_questions INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                owner TEXT,
+                options TEXT,
+                stop_requested INTEGER NOT NULL DEFAULT 0,
+                message TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_fingerprint ON jobs (fingerprint, status);
+            CREATE TABLE IF NOT EXISTS batches (
+                job_id TEXT NOT NULL,
+                batch_index INTEGER NOT NULL,
+                batch_size INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                thread_id TEXT,
+                run_id TEXT,
+                csv_content TEXT,
+                cell_index INTEGER,
+                question_count INTEGER,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                seconds REAL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (job_id, batch_index)
+            );
+        """)
+        # Journals written by older versions lack the queue, cell, question count and usage columns
+        migrations = {
+            "jobs": [("owner", "TEXT"), ("options", "TEXT"), ("stop_requested", "INTEGER NOT NULL DEFAULT 0"), ("message", "TEXT")],
+            "batches": [("cell_index", "INTEGER"), ("question_count", "INTEGER"), ("prompt_tokens", "INTEGER"), ("completion_tokens", "INTEGER"), ("seconds", "REAL")],
+        }
+        for table, table_columns in migrations.items():
+            columns = [row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")]
+            for column, column_type in table_columns:
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+        self.conn.commit()
+
+    def create_job(self, params, status="running", owner=None, options=None):
+        fingerprint = params_fingerprint(params)
+        now = time.time()
+        # Random, since the same parameters may be submitted twice within a millisecond
+        job_id = f"{fingerprint[:12]}-{uuid.uuid4().hex[:16]}"
+        self.conn.execute(
+            "INSERT INTO jobs (job_id, fingerprint, params, num_questions, status, owner, options, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, fingerprint, json.dumps(list(params), ensure_ascii=False), params[6], status, owner,
+             json.dumps(options) if options is not None else None, now, now)
+        )
+        self.conn.commit()
+        return job_id
+
+    def submit_job(self, params, owner, options):
+        # Queues a job for worker.py; owner is whoever submitted it, for fair scheduling
+        return self.create_job(params, "queued", owner, options)
+
+    def find_incomplete_job(self, params, exclude=()):
+        # Only jobs run in the app itself; queued jobs belong to the worker. exclude holds jobs already being resumed
+        rows = self.conn.execute(
+            "SELECT job_id FROM jobs WHERE fingerprint = ? AND status = 'running' AND owner IS NULL ORDER BY created_at DESC",
+            (params_fingerprint(params),)
+        ).fetchall()
+        return next((job_id for job_id, in rows if job_id not in exclude), None)
+
+    def job(self, job_id):
+        row = self.conn.execute(
+            "SELECT job_id, params, num_questions, status, owner, options, stop_requested, message, created_at FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return job_from_row(row) if row else None
+
+    def jobs_with_status(self, *statuses):
+        rows = self.conn.execute(
+            "SELECT job_id, params, num_questions, status, owner, options, stop_requested, message, created_at FROM jobs "
+            f"WHERE status IN ({','.join('?' * len(statuses))}) ORDER BY created_at",
+            statuses
+        ).fetchall()
+        return [job_from_row(row) for row in rows]
+
+    def set_job_status(self, job_id, status, message=None):
+        self.conn.execute(
+            "UPDATE jobs SET status = ?, message = COALESCE(?, message), updated_at = ? WHERE job_id = ?", (status, message, time.time(), job_id)
+        )
+        self.conn.commit()
+
+    def claim_job(self, job_id, status="running"):
+        # Moves a queued job on in one UPDATE, so when several workers share the journal only one of them gets it
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ? AND status = 'queued'", (status, time.time(), job_id)
+        )
+        self.conn.commit()
+        return cursor.rowcount == 1
+
+    def set_job_message(self, job_id, message):
+        self.conn.execute("UPDATE jobs SET message = ?, updated_at = ? WHERE job_id = ?", (message, time.time(), job_id))
+        self.conn.commit()
+
+    def request_stop(self, job_id):
+        # Picked up by the worker on its next poll; it finishes the job with what it has
+        self.conn.execute("UPDATE jobs SET stop_requested = 1, updated_at = ? WHERE job_id = ?", (time.time(), job_id))
+        self.conn.commit()
+
+    def batches(self, job_id):
+        rows = self.conn.execute(
+            "SELECT batch_index, batch_size, status, thread_id, run_id, csv_content, cell_index FROM batches WHERE job_id = ? ORDER BY batch_index",
+            (job_id,)
+        ).fetchall()
+        keys = ["batch_index", "batch_size", "status", "thread_id", "run_id", "csv_content", "cell_index"]
+        return [dict(zip(keys, row)) for row in rows]
+
+    def completed_questions(self, job_id):
+        # Questions kept after near-duplicates were dropped; batches journaled before that counted in full
+        row = self.conn.execute(
+            "SELECT COALESCE(SUM(COALESCE(question_count, batch_size)), 0) FROM batches WHERE job_id = ? AND status = 'completed'", (job_id,)
+        ).fetchone()
+        return row[0]
+
+    def completed_csv(self, job_id):
+        return [batch["csv_content"] for batch in self.batches(job_id) if batch["status"] == "completed"]
+
+    def start_batch(self, job_id, batch_index, batch_size, cell_index=None):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO batches (job_id, batch_index, batch_size, status, cell_index, updated_at) VALUES (?, ?, ?, 'running', ?, ?)",
+            (job_id, batch_index, batch_size, cell_index, time.time())
+        )
+        self.conn.commit()
+
+    def record_run(self, job_id, batch_index, thread_id, run_id):
+        self.conn.execute(
+            "UPDATE batches SET thread_id = ?, run_id = ?, updated_at = ? WHERE job_id = ? AND batch_index = ?",
+            (thread_id, run_id, time.time(), job_id, batch_index)
+        )
+        self.conn.commit()
+
+    def finish_batch(self, job_id, batch_index, csv_content, usage=None, seconds=None):
+        status = "completed" if csv_content else "failed"
+        self.conn.execute(
+            "UPDATE batches SET status = ?, csv_content = ?, prompt_tokens = ?, completion_tokens = ?, seconds = ?, updated_at = ? WHERE job_id = ? AND batch_index = ?",
+            (status, csv_content, usage.prompt_tokens if usage else None, usage.completion_tokens if usage else None,
+             seconds, time.time(), job_id, batch_index)
+        )
+        self.conn.commit()
+
+    def keep_questions(self, job_id, batch_index, csv_content, question_count):
+        # Replaces a completed batch's output with the questions the job kept from it
+        self.conn.execute(
+            "UPDATE batches SET csv_content = ?, question_count = ?, updated_at = ? WHERE job_id = ? AND batch_index = ? AND status = 'completed'",
+            (csv_content, question_count, time.time(), job_id, batch_index)
+        )
+        self.conn.commit()
+
+    def usage_history(self, question_types, language, limit=200):
+        # The most recent generated batches with their token usage, for pre-flight estimates; only
+        # batches of jobs with the same question types and language, whose questions cost alike
+        # params[5] is the question types, compared as a sorted JSON array; params[8] is the language
+        rows = self.conn.execute(
+            "SELECT batches.batch_size, batches.prompt_tokens, batches.completion_tokens, batches.seconds "
+            "FROM batches JOIN jobs ON jobs.job_id = batches.job_id WHERE batches.status = 'completed' "
+            "AND batches.completion_tokens IS NOT NULL AND batches.seconds IS NOT NULL AND json_extract(jobs.params, '$[8]') = ? "
+            "AND (SELECT json_group_array(value) FROM (SELECT value FROM json_each(jobs.params, '$[5]') ORDER BY value)) = ? "
+            "ORDER BY batches.updated_at DESC LIMIT ?",
+            (language, json.dumps(sorted(question_types), ensure_ascii=False, separators=(",", ":")), limit)
+        )
+        keys = ["batch_size", "prompt_tokens", "completion_tokens", "seconds"]
+        return [dict(zip(keys, usage)) for usage in rows]
+
+    def finish_job(self, job_id):
+        self.conn.execute("UPDATE jobs SET status = 'completed', updated_at = ? WHERE job_id = ?", (time.time(), job_id))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+def job_from_row(row):
+    job_id, params, num_questions, status, owner, options, stop_requested, message, created_at = row
+    return {
+        "job_id": job_id, "params": json.loads(params), "num_questions": num_questions, "status": status, "owner": owner,
+        "options": json.loads(options) if options else {}, "stop_requested": bool(stop_requested), "message": message, "created_at": created_at,
+    }
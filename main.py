@@ -1,23 +1,21 @@
-import openai
 import time
-import pandas as pd
-import io
+import uuid
 import streamlit as st
-import tiktoken
-from subject_data import SUBJECTS, TOPICS, PDF_NAMES
-import csv
-import concurrent.futures
-
-# Constants
-ASSISTANT_ID = "asst_WejSQNw2pN2DRnUOXpU3vMeX"
-MAX_COMPLETION_TOKENS = 16384
-MODEL_NAME = "gpt-4o-mini"
-MAX_TOKENS = 128000
-MAX_RETRIES = 3
-POLLING_INTERVAL = 2  # seconds
-MAX_RUN_TIME = 600  # 10 minutes in seconds
-MAX_QUESTIONS_PER_BATCH = 20
-MAX_PARALLEL_REQUESTS = 5
+from catalog import load_catalog
+from cache import ResponseCache
+from journal import JobJournal
+from csv_stream import EXPECTED_COLUMNS, CsvStreamParser
+from events import GenerationEvents
+from metrics import MetricsRecorder
+from pdf_index import PdfIndex
+
+# Streamlit reruns this script on every interaction, so only light modules are imported here.
+# openai, pandas and tiktoken are imported where they are first needed, after the API key prompt
+# has been drawn; see benchmarks/bench_startup.py for the import budget.
+
+LIVE_PREVIEW_REFRESH = 1.0  # seconds between live results table redraws
+BACKGROUND_POLL_INTERVAL = 2  # seconds between status checks of a background job
+SEARCH_RESULTS = 10  # catalog matches listed under the search box
 
 # CSS Styling
 CSS = """
@@ -56,40 +54,39 @@ CSS = """
 </style>
 """
 
+@st.cache_resource
+def open_pdf_index():
+    # One index for the whole process; a new one on every rerun would leave its connection open
+    return PdfIndex()
+
+@st.cache_resource
+def open_journal():
+    # Same for the job journal: one SQLite connection, not one per rerun
+    return JobJournal()
+
 def validate_api_key(api_key):
-    try:
-        client = openai.OpenAI(api_key=api_key)
-        client.models.list()
-        return True
-    except Exception as e:
-        st.error(f"Invalid API key: {str(e)}")
-        return False
+    # Cached per key for a few minutes, so widget changes do not each cost a models.list() round trip
+    from client_pool import pool
 
-def count_tokens(text, model="gpt-4o"):
-    encoding = tiktoken.encoding_for_model(model)
-    return len(encoding.encode(text))
+    error = pool.validate(api_key)
+    if error:
+        st.error(f"Invalid API key: {error}")
+        return False
+    return True
 
 def create_sidebar():
     st.sidebar.title("Question Generator")
 
-    subjects = st.sidebar.multiselect("Select Subject(s)", SUBJECTS)
-
-    all_topics = []
-    for subject in subjects:
-        all_topics.extend(TOPICS.get(subject, []))
+    # Option lists come from the shared catalog, in subject_data.py order
+    catalog = load_catalog()
+    query = st.sidebar.text_input("Find a topic or PDF", "")
+    if query:
+        matches = catalog.search(query)
+        st.sidebar.caption("\n\n".join(f"{subject} › {topic}" for subject, topic in matches[:SEARCH_RESULTS]) or "No matching topics.")
 
-    topics = st.sidebar.multiselect("Select Topic(s)", list(set(all_topics)))
-
-    pdf_options = []
-    for subject in subjects:
-        subject_pdfs = PDF_NAMES.get(subject, {})
-        if isinstance(subject_pdfs, dict):
-            for topic in topics:
-                pdf_options.extend(subject_pdfs.get(topic, []))
-        else:
-            pdf_options.extend(subject_pdfs)
-
-    selected_pdfs = st.sidebar.multiselect("Select Reference PDF(s)", list(set(pdf_options)))
+    subjects = st.sidebar.multiselect("Select Subject(s)", catalog.subjects)
+    topics = st.sidebar.multiselect("Select Topic(s)", catalog.topics_for(tuple(subjects)))
+    selected_pdfs = st.sidebar.multiselect("Select Reference PDF(s)", catalog.pdfs_for(tuple(subjects), tuple(topics)))
     keywords = st.sidebar.text_input("Keywords (Optional)", "")
     question_types = st.sidebar.multiselect("Question Type(s)", ["MCQ", "Fill in the Blanks", "Short Answer", "Descriptive/Essay", "Match the Following", "True/False"])
     num_questions = st.sidebar.number_input("Number of Questions", min_value=1, max_value=5000, value=5)
@@ -102,235 +99,209 @@ def create_sidebar():
 
     return subjects, topics, sub_topic, selected_pdfs, keywords, question_types, num_questions, difficulty_levels, language, question_source, year_range
 
-def process_csv_content(csv_content, language):
-    if "Not found in knowledge text" in csv_content or not csv_content.strip():
-        return None
-
-    # Split the content into lines
-    lines = csv_content.strip().split('\n')
-
-    # Identify headers and data lines
-    header_line = None
-    data_lines = []
-
-    for line in lines:
-        if not header_line and ("Subject" in line and "Topic" in line):
-            header_line = line
-        elif line.strip():  # Only add non-empty lines
-            data_lines.append(line)
-
-    if not header_line:
-        st.error("CSV header is missing in the assistant's response.")
-        return None
-
-    expected_columns = [
-        "Subject", "Topic", "Sub-Topic", "Question Type", "Question Text (English)", "Question Text (Hindi)",
-        "Option A (English)", "Option B (English)", "Option C (English)", "Option D (English)",
-        "Option A (Hindi)", "Option B (Hindi)", "Option C (Hindi)", "Option D (Hindi)",
-        "Correct Answer (English)", "Correct Answer (Hindi)", "Explanation (English)", "Explanation (Hindi)",
-        "Difficulty Level", "Language", "Source PDF Name", "Source Page Number", "Original Question Number", "Year of Original Question"
-    ]
-
-    # Process the CSV line by line
-    rows = []
-    for line in data_lines:
-        fields = line.split(',')
-        row_dict = {col: 'N/A' for col in expected_columns}
-        for i, field in enumerate(fields):
-            if i < len(expected_columns):
-                row_dict[expected_columns[i]] = field.strip()
-        rows.append(row_dict)
-
-    df = pd.DataFrame(rows)
-
-    # Fill NaN values with 'N/A'
-    df = df.fillna('N/A')
-
-    # Ensure numeric columns are of the correct type
-    numeric_columns = ["Source Page Number", "Original Question Number", "Year of Original Question"]
-    for col in numeric_columns:
-        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
-
-    # Ensure all text columns are of string type
-    text_columns = [col for col in df.columns if col not in numeric_columns]
-    for col in text_columns:
-        df[col] = df[col].astype(str)
-
-    # Handle language-specific columns
-    if language == "Hindi":
-        columns_to_show = [col for col in df.columns if "Hindi" in col or col in ["Subject", "Topic", "Sub-Topic", "Question Type", "Difficulty Level", "Language", "Source PDF Name", "Source Page Number", "Original Question Number", "Year of Original Question"]]
-    elif language == "English":
-        columns_to_show = [col for col in df.columns if "Hindi" not in col]
-    else:  # Both
-        columns_to_show = df.columns
-
-    # Validate that each row has a question text and at least two options
-    invalid_rows = df[
-        ((df["Question Text (English)"] == 'N/A') & (df["Question Text (Hindi)"] == 'N/A')) |
-        (((df["Option A (English)"] == 'N/A') & (df["Option B (English)"] == 'N/A')) &
-         ((df["Option A (Hindi)"] == 'N/A') & (df["Option B (Hindi)"] == 'N/A')))
-    ]
-    if not invalid_rows.empty:
-        st.warning(f"Found {len(invalid_rows)} rows with missing question text or insufficient options. These rows will be kept but marked as potentially invalid.")
-
-    return df[columns_to_show]
-
-def generate_questions_batch(params, api_key, batch_size, language):
-    client = openai.OpenAI(api_key=api_key)
-    subjects, topics, sub_topic, selected_pdfs, keywords, question_types, num_questions, difficulty_levels, language_param, question_source, year_range = params
-
-    subjects_text = ", ".join(subjects) if subjects else "No specific subject selected"
-    topics_text = ", ".join(topics) if topics else "No specific topic selected"
-    sub_topic_text = sub_topic if sub_topic else "No specific sub-topic selected"
-    pdf_text = ", ".join(selected_pdfs) if selected_pdfs else "All available PDFs"
-    question_types_text = ", ".join(question_types) if question_types else "All question types"
-    difficulty_levels_text = ", ".join(difficulty_levels) if difficulty_levels else "All difficulty levels"
-
-    prompt = f"""
-You are an advanced AI assistant designed to generate high-quality exam questions for UPSC and other public service commission exams in India. You will use a comprehensive Knowledge Base (KB) of Previous Year Questions (PYQs) provided in the attached PDF files. Your goal is to emulate expert examiners' methods, ensuring precision, consistency, and adherence to the requested specifications.
-
-# Input Parameters:
-- **Subject(s):** {subjects_text}
-- **Topic(s):** {topics_text}
-- **Sub-Topic:** {sub_topic_text}
-- **Keywords:** {keywords}
-- **Question Type(s):** {question_types_text}
-- **Number of Questions:** {batch_size}
-- **Difficulty Level(s):** {difficulty_levels_text}
-- **Language:** {language_param}
-- **Question Source:** {question_source}
-- **Year Range:** {year_range[0]} to {year_range[1]}
-- **Reference Material:** {pdf_text}
-
-# Instructions:
-
-Follow all the detailed steps provided previously to generate high-quality exam questions. Ensure that you strictly adhere to the output format specified, which is a CSV-friendly format with the following headers:
-
-"Subject", "Topic", "Sub-Topic", "Question Type", "Question Text (English)", "Question Text (Hindi)", "Option A (English)", "Option B (English)", "Option C (English)", "Option D (English)", "Option A (Hindi)", "Option B (Hindi)", "Option C (Hindi)", "Option D (Hindi)", "Correct Answer (English)", "Correct Answer (Hindi)", "Explanation (English)", "Explanation (Hindi)", "Difficulty Level", "Language", "Source PDF Name", "Source Page Number", "Original Question Number", "Year of Original Question"
-
-**Important Notes:**
-- Ensure all fields are populated correctly; if a field is not applicable, leave it blank.
-- Do not include any text before or after the CSV content.
-- **For any missing values**, leave that column blank (instead of skipping it).
-- **Ensure that every column is properly mapped** in the exact sequence specified in the header.
-- Ensure that the Correct Answer (English) field contains the full text of the correct option.
-- Explanations should be detailed, at least 2-3 paragraphs, and explain why other options are not suitable.
-- Use only information that can be directly verified from the Knowledge Base.
-- If no relevant entry is found in the Knowledge Base, respond with: "Not found in knowledge text."
-"""
+def load_results(csv_contents):
+    # Batches are parsed once into the session's compact frame; their CSV text is not kept
+    from results import compact_results
 
-    retry_count = 0
-
-    while retry_count < MAX_RETRIES:
-        try:
-            thread = client.beta.threads.create()
-            message = client.beta.threads.messages.create(
-                thread_id=thread.id,
-                role="user",
-                content=prompt
-            )
-            run = client.beta.threads.runs.create(
-                thread_id=thread.id,
-                assistant_id=ASSISTANT_ID,
-                model=MODEL_NAME
-            )
-
-            start_time = time.time()
-
-            while True:
-                time.sleep(POLLING_INTERVAL)
-                run = client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
-
-                if run.status == "completed":
-                    messages = client.beta.threads.messages.list(thread_id=thread.id)
-                    assistant_messages = [msg for msg in messages.data if msg.role == "assistant"]
-                    if not assistant_messages:
-                        st.error("No assistant response found.")
-                        return None
-
-                    last_message = assistant_messages[-1]
-                    csv_content = last_message.content[0].text.value
-                    return csv_content  # Return the raw CSV content
-
-                elif run.status in ["failed", "cancelled", "expired"]:
-                    st.error(f"Run {run.status}. Error: {run.last_error}. Retrying...")
-                    retry_count += 1
-                    break
-                elif run.status == "requires_action":
-                    st.error("Run requires action. Retrying...")
-                    retry_count += 1
-                    break
-
-                if time.time() - start_time > MAX_RUN_TIME:
-                    st.warning("Run took too long. Cancelling and retrying...")
-                    client.beta.threads.runs.cancel(thread_id=thread.id, run_id=run.id)
-                    retry_count += 1
-                    break
-
-        except openai.APIError as e:
-            st.error(f"OpenAI API error: {str(e)}")
-            retry_count += 1
-        except Exception as e:
-            st.error(f"An unexpected error occurred: {str(e)}")
-            retry_count += 1
-
-    st.error(f"Failed to generate questions after {MAX_RETRIES} attempts.")
-    return None
-
-def generate_questions_parallel(params, api_key, num_questions, language):
-    QUESTIONS_PER_BATCH = 10
-    batches = []
-    remaining_questions = num_questions
-    while remaining_questions > 0:
-        batch_size = min(remaining_questions, QUESTIONS_PER_BATCH)
-        batches.append(batch_size)
-        remaining_questions -= batch_size
-
-    all_csv_content = []
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_PARALLEL_REQUESTS) as executor:
-        future_to_batch = {executor.submit(generate_questions_batch, params, api_key, batch_size, language): batch_size for batch_size in batches}
-        completed_questions = 0
-
-        for future in concurrent.futures.as_completed(future_to_batch):
-            batch_size = future_to_batch[future]
-            try:
-                csv_content = future.result()
-                if csv_content:
-                    all_csv_content.append(csv_content)
-                    completed_questions += batch_size
-                    progress = completed_questions / num_questions
-                    progress_bar.progress(progress)
-                    status_text.text(f"Generated {completed_questions}/{num_questions} questions")
-                else:
-                    st.warning(f"Failed to generate a batch of {batch_size} questions.")
-            except Exception as exc:
-                st.error(f"An error occurred while generating a batch of {batch_size} questions: {str(exc)}")
-
-    # Combine all CSV content
-    combined_csv_content = '\n'.join(all_csv_content)
-
-    # Remove duplicate headers
-    lines = combined_csv_content.split('\n')
-    header = lines[0]
-    data_lines = [line for line in lines[1:] if line.strip()]  # Remove empty lines
-    final_csv_content = header + '\n' + '\n'.join(data_lines)
-
-    return final_csv_content
+    try:
+        st.session_state.results = compact_results("\n".join(csv_contents))
+    except ValueError as e:
+        st.error(str(e))
+        st.session_state.results = None
+    st.session_state.issues = None
+
+def process_results(results, language, year_range, num_questions):
+    # Every row is checked in one pass; the labels become the Issues column of the processed view
+    from validation import issue_labels, issue_summary, missing_count, validate_questions
+
+    issues = validate_questions(results, language, year_range)
+    failing = int(issues.any(axis=1).sum())
+    missing = missing_count(results, num_questions)
+    st.session_state.validation = {"failing": failing, "missing": missing}
+    if failing:
+        st.warning(f"{failing} of {len(results)} rows failed validation: {issue_summary(issues)}. See the Issues column.")
+    if missing:
+        st.warning(f"{missing} of the {num_questions} requested questions are missing.")
+    return issue_labels(issues).astype("category")
+
+def show_page(results, columns, key, issues=None):
+    # Only one page of rows goes to the browser on each rerun
+    from results import page_count, page_slice
+
+    pages = page_count(len(results))
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, key=key) if pages > 1 else 1
+    rows = results.iloc[page_slice(page)][columns]
+    if issues is not None:
+        rows = rows.assign(Issues=issues.iloc[page_slice(page)].to_numpy())
+    st.dataframe(rows)
+
+def cache_status(text, cache):
+    if cache is None:
+        return text
+    return f"{text} (cache: {cache.hits} hits, {cache.misses} misses)"
+
+class StreamlitEvents(GenerationEvents):
+    # Runs on the script thread between awaits, so Streamlit elements can be updated directly
+    def __init__(self, num_questions, cache=None):
+        self.num_questions = num_questions
+        self.cache = cache
+        self.all_csv_content = []
+        self.completed_questions = 0
+        self.progress_bar = st.progress(0)
+        self.status_text = st.empty()
+        self.live_table = st.empty()
+        self.live_rows = {}
+        self.last_render = 0.0
+
+    def error(self, message):
+        st.error(message)
+
+    def warning(self, message):
+        st.warning(message)
+
+    def render_live_rows(self, force=False):
+        if not force and time.time() - self.last_render < LIVE_PREVIEW_REFRESH:
+            return
+        self.last_render = time.time()
+        import pandas as pd
+
+        rows = [row for parser in self.live_rows.values() for row in parser.rows()]
+        if rows:
+            self.live_table.dataframe(pd.DataFrame(rows, columns=EXPECTED_COLUMNS))
+
+    def batch_line(self, index, line):
+        parser = self.live_rows.setdefault(index, CsvStreamParser())
+        if parser.feed(line + '\n'):
+            self.render_live_rows()
+
+    def batch_done(self, index, question_count, csv_content):
+        if csv_content:
+            self.all_csv_content.append(csv_content)
+            # The final response replaces whatever was streamed, including rows from retried attempts
+            parser = CsvStreamParser()
+            parser.feed(csv_content)
+            parser.close()
+            self.live_rows[index] = parser
+            self.completed_questions += question_count
+            progress = min(self.completed_questions / self.num_questions, 1.0)
+            self.progress_bar.progress(progress)
+            self.status_text.text(cache_status(f"Generated {self.completed_questions}/{self.num_questions} questions", self.cache))
+        else:
+            self.live_rows.pop(index, None)
+            st.warning(f"Failed to generate a batch of {question_count} questions.")
+        self.render_live_rows(force=True)
+
+class RepairEvents(GenerationEvents):
+    def error(self, message):
+        st.error(message)
+
+    def warning(self, message):
+        st.warning(message)
+
+def generate_questions_parallel(params, api_key, num_questions, language, cache=None, replay_only=False, journal=None, job_id=None, metrics=None, retriever=None,
+                                max_concurrency=None, token_budget=0):
+    from estimator import TokenBudget
+    from pipeline import MAX_PARALLEL_REQUESTS, generate_questions
+
+    max_concurrency = max_concurrency or MAX_PARALLEL_REQUESTS
+    events = StreamlitEvents(num_questions, cache)
+    generate_questions(params, api_key, events, cache, replay_only, journal, job_id, max_concurrency, metrics, retriever,
+                       TokenBudget(token_budget) if token_budget else None)
+    return events.all_csv_content, events.completed_questions
+
+def request_finish_now(job_id):
+    st.session_state.finish_job = job_id
+
+@st.fragment(run_every=BACKGROUND_POLL_INTERVAL)
+def show_background_job(journal, job_id):
+    job = journal.job(job_id)
+    if job["status"] not in ("queued", "running"):
+        # Finished: load what it generated into the page and redraw everything
+        st.session_state.background_job = None
+        st.session_state.background_result = job
+        load_results(journal.completed_csv(job_id))
+        st.rerun(scope="app")
+    completed = journal.completed_questions(job_id)
+    st.text(f"Background job {job_id}: {job['status']}, {completed}/{job['num_questions']} questions")
+    st.progress(min(completed / job["num_questions"], 1.0))
+    if job["message"]:
+        st.caption(job["message"])
+    if job["stop_requested"]:
+        st.caption("Finishing with the batches that are done...")
+    else:
+        st.button("Finish now", on_click=journal.request_stop, args=(job_id,), help="Keep the batches that have finished and cancel the rest")
+
+@st.cache_data(ttl=60, show_spinner=False)
+def estimate_for(params, num_questions, max_concurrency, _journal):
+    # Sidebar reruns with the same job reuse the estimate; the ttl picks up batches finished since
+    from estimator import estimate_job
+    from pipeline import MAX_COMPLETION_TOKENS, MAX_QUESTIONS_PER_BATCH, MODEL_NAME
+
+    return estimate_job(params, num_questions, max_concurrency, _journal.usage_history(params[5], params[8]),
+                        MAX_COMPLETION_TOKENS, MAX_QUESTIONS_PER_BATCH, MODEL_NAME)
+
+def show_estimate(params, num_questions, max_concurrency, journal, token_budget):
+    from estimator import format_duration
+
+    estimate = estimate_for(params, num_questions, max_concurrency, journal)
+    basis = f"from {estimate['history_batches']} recent batches" if estimate["history_batches"] else "from built-in assumptions"
+    st.info(f"Estimate ({basis}): {estimate['batches']} batches of about {estimate['batch_size']} questions, "
+            f"{estimate['input_tokens']:,} input + {estimate['output_tokens']:,} output tokens, "
+            f"about ${estimate['cost']:.2f} and {format_duration(estimate['seconds'])} at {max_concurrency} concurrent batches.")
+    if token_budget and estimate["total_tokens"] > token_budget:
+        share = token_budget / estimate["total_tokens"]
+        st.warning(f"The token budget covers about {share:.0%} of this job; generation stops at roughly {int(num_questions * share)} questions.")
+
+def format_seconds(value):
+    return "-" if value is None else f"{value:.2f} s"
+
+def show_diagnostics(metrics):
+    import pandas as pd
+
+    summary = metrics.summary()
+    if not summary["batches"]:
+        return
+    with st.expander("Run diagnostics"):
+        rows = [
+            ("Batch latency", format_seconds(summary["latency"]["p50"]), format_seconds(summary["latency"]["p95"])),
+            ("Wait for a slot", format_seconds(summary["queue_wait"]["p50"]), format_seconds(summary["queue_wait"]["p95"])),
+            ("Run queued", format_seconds(summary["queued"]["p50"]), format_seconds(summary["queued"]["p95"])),
+            ("Run in progress", format_seconds(summary["in_progress"]["p50"]), format_seconds(summary["in_progress"]["p95"])),
+        ]
+        st.table(pd.DataFrame(rows, columns=["Stage", "p50", "p95"]))
+
+        tokens_per_question = summary["tokens_per_question"]
+        calls_per_question = summary["api_calls_per_question"]
+        st.text(f"Batches: {summary['batches']} {summary['statuses']} from {summary['sources']}")
+        st.text(f"Tokens: {summary['prompt_tokens']} prompt, {summary['completion_tokens']} completion, "
+                f"{'-' if tokens_per_question is None else f'{tokens_per_question:.0f}'} completion tokens per question")
+        st.text(f"API calls per question: {'-' if calls_per_question is None else f'{calls_per_question:.2f}'}, "
+                f"polls: {summary['polls']}, 429s: {summary['rate_limited']}, "
+                f"hedged batches: {summary['hedged']} ({summary['hedges_won']} won by the duplicate)")
+        if summary["retry_causes"]:
+            st.text(f"Retries: {summary['retry_causes']}")
+
+        st.download_button("Download metrics (JSONL)", metrics.jsonl(), file_name="batch_metrics.jsonl", mime="application/jsonl")
+        st.download_button("Download metrics (OpenMetrics)", metrics.openmetrics(), file_name="metrics.prom", mime="text/plain")
 
 def main():
     st.title("Drishti QueAI")
     st.markdown(CSS, unsafe_allow_html=True)
 
     # Initialize session state
-    if 'csv_content' not in st.session_state:
-        st.session_state.csv_content = None
+    if 'results' not in st.session_state:
+        st.session_state.results = None
     if 'params' not in st.session_state:
         st.session_state.params = None
-    if 'processed_df' not in st.session_state:
-        st.session_state.processed_df = None
+    if 'issues' not in st.session_state:
+        st.session_state.issues = None
+    if 'metrics' not in st.session_state:
+        st.session_state.metrics = None
+    if 'validation' not in st.session_state:
+        st.session_state.validation = None
+    if 'background_job' not in st.session_state:
+        st.session_state.background_job = None
+    owner = st.session_state.setdefault("owner", uuid.uuid4().hex[:12])  # this session, for fair scheduling in the worker
 
     api_key = st.text_input("Enter your API Key:", type="password")
 
@@ -341,32 +312,115 @@ def main():
     if not validate_api_key(api_key):
         return
 
+    # The key prompt has been drawn by now; the rest of the page needs the heavy modules
+    from pipeline import MAX_PARALLEL_REQUESTS
+    from repair import repair_questions
+    from results import NUMERIC_COLUMNS, language_columns, results_to_csv
+
     params = create_sidebar()
     st.session_state.params = params
     num_questions = params[6]  # Extract num_questions from params
 
-    if st.button("Generate Questions"):
+    use_cache = st.sidebar.checkbox("Use response cache", value=True)
+    replay_only = st.sidebar.checkbox("Replay from cache only", value=False, disabled=not use_cache)
+    generation_mode = st.sidebar.selectbox("Generation mode", ["Assistants (file search)", "Direct (local PDF index)"])
+
+    retriever = None
+    if generation_mode.startswith("Direct"):
+        retriever = open_pdf_index()
+        if retriever.is_empty():
+            st.error("The local PDF index is empty. Build it with: python pdf_index.py build path/to/pdfs")
+            return
+    max_concurrency = st.sidebar.number_input("Max concurrent batches", min_value=1, max_value=200, value=MAX_PARALLEL_REQUESTS)
+    token_budget = st.sidebar.number_input("Token budget (0 = no limit)", min_value=0, value=0, step=100000)
+    background = st.sidebar.checkbox("Run in background worker", value=True)
+    if background:
+        st.sidebar.caption("Background jobs are run by worker.py with its own API key and concurrency limit, shared fairly with other users.")
+
+    journal = open_journal()
+
+    # Restore the results of the job in the URL after a refresh or a new session
+    job_param = st.query_params.get("job")
+    if st.session_state.results is None and job_param:
+        job = journal.job(job_param)
+        if job is not None and job["status"] in ("completed", "stopped"):
+            load_results(journal.completed_csv(job_param))
+        elif job is not None and job["owner"] is not None and job["status"] in ("queued", "running"):
+            st.session_state.background_job = job_param
+
+    background_result = st.session_state.pop("background_result", None)
+    if background_result:
+        completed = journal.completed_questions(background_result["job_id"])
+        if background_result["status"] == "completed":
+            st.success(f"Generated {completed} questions successfully.")
+        elif completed:
+            st.info(f"The background job {background_result['status']} with {completed}/{background_result['num_questions']} questions. {background_result['message'] or ''}")
+        else:
+            st.error(f"No questions were generated. {background_result['message'] or ''}")
+
+    # "Finish now" stopped the last run: show what it had finished, the rest was cancelled with it
+    finish_job = st.session_state.pop("finish_job", None)
+    if finish_job:
+        load_results(journal.completed_csv(finish_job))
+        st.info(f"Finished early with {journal.completed_questions(finish_job)} questions; the remaining batches were cancelled.")
+
+    interrupted_job_id = journal.find_incomplete_job(params)
+    if interrupted_job_id:
+        st.info(f"An interrupted job with these settings has {journal.completed_questions(interrupted_job_id)}/{num_questions} questions saved. Generate Questions will resume it.")
+
+    show_estimate(params, num_questions, max_concurrency, journal, token_budget)
+
+    if st.session_state.background_job:
+        show_background_job(journal, st.session_state.background_job)
+        generate = False
+    else:
+        generate = st.button("Generate Questions")
+
+    if generate and background:
+        # The worker picks the job up from the journal; this page only polls its status
+        options = {"mode": "direct" if retriever is not None else "assistants", "token_budget": token_budget or None,
+                   "use_cache": use_cache, "replay_only": replay_only}
+        job_id = journal.submit_job(params, owner, options)
+        st.query_params["job"] = job_id
+        st.session_state.background_job = job_id
+        st.rerun()
+
+    if generate and not background:
         with st.spinner("Generating questions..."):
+            cache = ResponseCache() if use_cache else None
+            job_id = interrupted_job_id or journal.create_job(params)
+            st.query_params["job"] = job_id
+            st.session_state.metrics = MetricsRecorder()
+            st.button("Finish now", on_click=request_finish_now, args=(job_id,), help="Keep the batches that have finished and cancel the rest")
             try:
-                csv_content = generate_questions_parallel(params, api_key, num_questions, params[8])  # params[8] is language
-                if csv_content:
-                    st.session_state.csv_content = csv_content
-                    st.session_state.processed_df = None  # Reset processed dataframe
-                    st.success(f"Generated {num_questions} questions successfully.")
+                batch_csv, generated_questions = generate_questions_parallel(params, api_key, num_questions, params[8], cache, replay_only, journal, job_id, st.session_state.metrics, retriever, max_concurrency, token_budget)  # params[8] is language
+                if cache is not None:
+                    st.info(f"Response cache: {cache.hits} hits, {cache.misses} misses")
+                if batch_csv:
+                    load_results(batch_csv)
+                    st.success(f"Generated {generated_questions} questions successfully.")
                 else:
                     st.error("No questions were generated. Please try again.")
             except Exception as e:
                 st.error(f"An error occurred while generating questions: {str(e)}")
+            finally:
+                if cache is not None:
+                    cache.close()
+
+    if st.session_state.metrics is not None:
+        show_diagnostics(st.session_state.metrics)
 
-    # Always display CSV content if available
-    if st.session_state.csv_content:
-        st.subheader("Generated CSV Content")
-        st.text_area("Raw CSV", st.session_state.csv_content, height=200)
-        
-        # Provide option to download raw CSV
+    # Always display the generated questions if available
+    results = st.session_state.results
+    if results is not None:
+        st.subheader("Generated Questions")
+        st.text(f"{len(results)} questions")
+        show_page(results, EXPECTED_COLUMNS, "raw_page")
+
+        # The CSV is built only when the download is clicked
         st.download_button(
             label="Download Raw CSV",
-            data=st.session_state.csv_content,
+            data=lambda: results_to_csv(results),
             file_name="raw_generated_questions.csv",
             mime="text/csv"
         )
@@ -374,30 +428,51 @@ def main():
         if st.button("Process CSV"):
             with st.spinner("Processing CSV..."):
                 try:
-                    df = process_csv_content(st.session_state.csv_content, st.session_state.params[8])  # params[8] is language
-                    if df is not None and not df.empty:
-                        st.session_state.processed_df = df
-                        st.success(f"Processed {len(df)} questions successfully.")
-                        st.info(f"Columns in processed data: {', '.join(df.columns)}")
-                        st.info(f"Number of rows with all 'N/A' values: {df.eq('N/A').all(axis=1).sum()}")
-                    else:
-                        st.error("Failed to process CSV content. Please check the format.")
+                    params = st.session_state.params
+                    st.session_state.issues = process_results(results, params[8], params[10], params[6])  # language, year range, number of questions
+                    columns = language_columns(params[8])
+                    text_columns = [col for col in columns if col not in NUMERIC_COLUMNS]
+                    st.success(f"Processed {len(results)} questions successfully.")
+                    st.info(f"Columns in processed data: {', '.join(columns + ['Issues'])}")
+                    st.info(f"Number of rows with all 'N/A' values: {results[text_columns].eq('N/A').all(axis=1).sum()}")
                 except Exception as e:
                     st.error(f"An error occurred while processing the CSV: {str(e)}")
                     st.text("Error details:")
                     st.exception(e)
 
-    # Display processed dataframe if available
-    if st.session_state.processed_df is not None:
+    # Display processed questions if available
+    issues = st.session_state.issues
+    if results is not None and issues is not None:
         st.subheader("Processed Questions")
-        st.dataframe(st.session_state.processed_df)
-        csv_data = st.session_state.processed_df.to_csv(index=False)
+        summary = st.session_state.pop("repair_summary", None)
+        if summary:
+            st.success(f"Repaired {summary['repaired']} rows and added {summary['added']} questions in {summary['batches']} small batches; "
+                       f"{summary['still_failing']} rows still fail validation.")
+        columns = language_columns(st.session_state.params[8])
+        show_page(results, columns, "processed_page", issues)
         st.download_button(
             label="Download Processed CSV",
-            data=csv_data,
+            data=lambda: results_to_csv(results.assign(Issues=issues), columns + ["Issues"]),
             file_name="processed_generated_questions.csv",
             mime="text/csv"
         )
 
+        # Only the failing rows and the missing questions are sent back, a few per batch
+        validation = st.session_state.validation
+        if validation and (validation["failing"] or validation["missing"]):
+            label = " and ".join(part for part in [f"repair {validation['failing']} row{'s' if validation['failing'] > 1 else ''}" if validation["failing"] else "",
+                                                   f"add {validation['missing']} missing" if validation["missing"] else ""] if part)
+            if st.button(label.capitalize()):
+                with st.spinner("Repairing questions..."):
+                    try:
+                        params = st.session_state.params
+                        results, summary = repair_questions(results, params, api_key, RepairEvents(), retriever, max_concurrency)
+                        st.session_state.results = results
+                        st.session_state.issues = process_results(results, params[8], params[10], params[6])
+                        st.session_state.repair_summary = summary
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"An error occurred while repairing questions: {str(e)}")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,241 @@
+import contextlib
+import contextvars
+import json
+import math
+import os
+import time
+from collections import Counter
+
+METRICS_PREFIX = "question_generator"
+SUMMARY_QUANTILES = (0.5, 0.95)
+TERMINAL_RUN_STATUSES = ["completed", "failed", "cancelled", "expired", "incomplete", "requires_action"]
+
+# The batch whose work the current task is doing; asyncio tasks each get their own copy
+current_batch = contextvars.ContextVar("current_batch", default=None)
+
+def percentile(values, q):
+    # Nearest-rank percentile; None when there is nothing to rank
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+class BatchMetrics:
+    def __init__(self, job, index, batch_size, cell=None, source="api"):
+        self.job = job
+        self.index = index
+        self.batch_size = batch_size
+        self.cell = cell
+        self.source = source  # api, cache, journal or index
+        self.status = None
+        self.created = time.time()
+        self.started = time.monotonic()
+        self.queue_wait = None
+        self.duration = None
+        self.spans = []
+        self.retry_causes = []
+        self.api_calls = 0
+        self.rate_limited = 0
+        self.request_retries = 0
+        self.throttle_wait = 0.0
+        self.polls = 0
+        self.run_status = None
+        self.run_status_since = None
+        self.status_seconds = Counter()
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.questions = 0
+        self.hedged = False  # a duplicate attempt was started because this batch was a straggler
+        self.hedge_won = False  # and the duplicate finished first
+
+    def slot_acquired(self):
+        self.queue_wait = time.monotonic() - self.started
+
+    @contextlib.contextmanager
+    def span(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.spans.append({"name": name, "start": round(start - self.started, 4), "duration": round(time.monotonic() - start, 4)})
+
+    def observe_run(self, run):
+        now = time.monotonic()
+        if self.run_status is not None:
+            self.status_seconds[self.run_status] += now - self.run_status_since
+        self.run_status = run.status
+        self.run_status_since = now
+        if run.status in TERMINAL_RUN_STATUSES:
+            self.run_status = None
+            if run.usage:
+                self.observe_usage(run.usage)
+
+    def observe_usage(self, usage):
+        self.prompt_tokens += usage.prompt_tokens
+        self.completion_tokens += usage.completion_tokens
+
+    def attempt_record(self):
+        # A separate record for a duplicate attempt of this batch, so its calls and tokens stay apart
+        return BatchMetrics(self.job, self.index, self.batch_size, self.cell, self.source)
+
+    def adopt(self, attempt):
+        # The duplicate won: report its calls and run instead of the cancelled original's
+        offset = attempt.started - self.started
+        self.spans = [{**span, "start": round(span["start"] + offset, 4)} for span in attempt.spans]
+        self.retry_causes = attempt.retry_causes
+        self.api_calls = attempt.api_calls
+        self.rate_limited = attempt.rate_limited
+        self.request_retries = attempt.request_retries
+        self.throttle_wait = attempt.throttle_wait
+        self.polls = attempt.polls
+        self.status_seconds = attempt.status_seconds
+        self.prompt_tokens = attempt.prompt_tokens
+        self.completion_tokens = attempt.completion_tokens
+
+    def close(self, status, questions):
+        self.status = status
+        self.questions = questions
+        self.duration = time.monotonic() - self.started
+
+    def to_dict(self):
+        return {
+            "job": self.job, "batch_index": self.index, "batch_size": self.batch_size, "cell": self.cell,
+            "source": self.source, "status": self.status, "questions": self.questions, "created": self.created,
+            "duration": self.duration, "queue_wait": self.queue_wait, "attempts": len(self.retry_causes) + 1,
+            "retry_causes": self.retry_causes, "api_calls": self.api_calls, "rate_limited": self.rate_limited,
+            "request_retries": self.request_retries, "throttle_wait": round(self.throttle_wait, 4), "polls": self.polls,
+            "hedged": self.hedged, "hedge_won": self.hedge_won,
+            "queued_seconds": round(self.status_seconds["queued"], 4),
+            "in_progress_seconds": round(self.status_seconds["in_progress"], 4),
+            "prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens, "spans": self.spans,
+        }
+
+async def in_batch(batch, awaitable):
+    # Runs awaitable as a task's work with batch as its current batch
+    current_batch.set(batch)
+    return await awaitable
+
+def span(name):
+    batch = current_batch.get()
+    return batch.span(name) if batch is not None else contextlib.nullcontext()
+
+def record_retry(cause):
+    batch = current_batch.get()
+    if batch is not None:
+        batch.retry_causes.append(cause)
+
+def record_run(run, polled=False):
+    batch = current_batch.get()
+    if batch is not None:
+        batch.polls += polled
+        batch.observe_run(run)
+
+def record_usage(usage):
+    batch = current_batch.get()
+    if batch is not None:
+        batch.observe_usage(usage)
+
+class MetricsRecorder:
+    # Collects per-batch metrics for one or more jobs and exports them as JSONL and OpenMetrics text
+    def __init__(self, jsonl_path=None):
+        self.batches = []
+        self.jsonl_path = jsonl_path
+
+    def new_batch(self, job, index, batch_size, cell=None, source="api"):
+        batch = BatchMetrics(job, index, batch_size, cell, source)
+        self.batches.append(batch)
+        return batch
+
+    def close_batch(self, batch, status, questions):
+        batch.close(status, questions)
+        if self.jsonl_path:
+            with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(batch.to_dict(), ensure_ascii=False) + "\n")
+
+    def jsonl(self):
+        return "".join(json.dumps(batch.to_dict(), ensure_ascii=False) + "\n" for batch in self.batches if batch.status is not None)
+
+    def summary(self):
+        closed = [batch for batch in self.batches if batch.status is not None]
+        generated = [batch for batch in closed if batch.source == "api"]
+        questions = sum(batch.questions for batch in closed)
+        generated_questions = sum(batch.questions for batch in generated)
+        completion_tokens = sum(batch.completion_tokens for batch in generated)
+        api_calls = sum(batch.api_calls for batch in generated)
+
+        def quantiles(values):
+            return {f"p{int(q * 100)}": percentile(values, q) for q in SUMMARY_QUANTILES}
+
+        return {
+            "batches": len(closed),
+            "statuses": dict(Counter(batch.status for batch in closed)),
+            "sources": dict(Counter(batch.source for batch in closed)),
+            "questions": questions,
+            "latency": quantiles([batch.duration for batch in generated]),
+            "queue_wait": quantiles([batch.queue_wait for batch in generated if batch.queue_wait is not None]),
+            "queued": quantiles([batch.status_seconds["queued"] for batch in generated]),
+            "in_progress": quantiles([batch.status_seconds["in_progress"] for batch in generated]),
+            "prompt_tokens": sum(batch.prompt_tokens for batch in generated),
+            "completion_tokens": completion_tokens,
+            "tokens_per_question": completion_tokens / generated_questions if generated_questions else None,
+            "api_calls_per_question": api_calls / generated_questions if generated_questions else None,
+            "polls": sum(batch.polls for batch in generated),
+            "hedged": sum(batch.hedged for batch in generated),
+            "hedges_won": sum(batch.hedge_won for batch in generated),
+            "rate_limited": sum(batch.rate_limited for batch in generated),
+            "retry_causes": dict(Counter(cause for batch in generated for cause in batch.retry_causes)),
+        }
+
+    def openmetrics(self):
+        closed = [batch for batch in self.batches if batch.status is not None]
+        generated = [batch for batch in closed if batch.source == "api"]
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# TYPE {METRICS_PREFIX}_{name} {kind}")
+            lines.append(f"# HELP {METRICS_PREFIX}_{name} {help_text}")
+            for suffix, labels, value in samples:
+                label_text = ",".join(f'{key}="{escape_label(val)}"' for key, val in labels.items())
+                lines.append(f"{METRICS_PREFIX}_{name}{suffix}{{{label_text}}} {value:g}" if label_text else f"{METRICS_PREFIX}_{name}{suffix} {value:g}")
+
+        def summary_samples(values):
+            samples = [("", {"quantile": str(q)}, percentile(values, q)) for q in SUMMARY_QUANTILES if values]
+            return samples + [("_sum", {}, sum(values)), ("_count", {}, len(values))]
+
+        metric("batches", "counter", "Finished batches by status and source.",
+               [("_total", {"status": status, "source": source}, count)
+                for (status, source), count in sorted(Counter((batch.status, batch.source) for batch in closed).items())])
+        metric("questions", "counter", "Questions kept after de-duplication.",
+               [("_total", {}, sum(batch.questions for batch in closed))])
+        metric("batch_duration_seconds", "summary", "Wall time of generated batches, including queueing and retries.",
+               summary_samples([batch.duration for batch in generated]))
+        metric("batch_queue_wait_seconds", "summary", "Time a batch waited for a concurrency slot.",
+               summary_samples([batch.queue_wait for batch in generated if batch.queue_wait is not None]))
+        metric("run_status_seconds", "counter", "Time runs spent in each server-side status.",
+               [("_total", {"status": status}, sum(batch.status_seconds[status] for batch in generated)) for status in ("queued", "in_progress")])
+        metric("tokens", "counter", "Tokens reported in run usage.",
+               [("_total", {"kind": "prompt"}, sum(batch.prompt_tokens for batch in generated)),
+                ("_total", {"kind": "completion"}, sum(batch.completion_tokens for batch in generated))])
+        metric("api_requests", "counter", "HTTP requests sent to the API, including retries.",
+               [("_total", {}, sum(batch.api_calls for batch in generated))])
+        metric("rate_limited_requests", "counter", "Requests answered with 429.",
+               [("_total", {}, sum(batch.rate_limited for batch in generated))])
+        metric("run_polls", "counter", "Run status polls.",
+               [("_total", {}, sum(batch.polls for batch in generated))])
+        metric("hedged_batches", "counter", "Batches that got a duplicate attempt for running long.",
+               [("_total", {}, sum(batch.hedged for batch in generated))])
+        metric("batch_retries", "counter", "Batch attempts retried, by cause.",
+               [("_total", {"cause": cause}, count)
+                for cause, count in sorted(Counter(cause for batch in generated for cause in batch.retry_causes).items())])
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write_openmetrics(self, path):
+        # Written whole and renamed so a textfile collector never reads half a file
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(self.openmetrics())
+        os.replace(temp_path, path)
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
@@ -0,0 +1,124 @@
+import argparse
+import os
+import re
+import sqlite3
+import sys
+from functools import lru_cache
+
+# Local BM25 index over the reference PDFs, built offline:
+#   python pdf_index.py build path/to/pdfs        (needs pypdf; .txt files work without it)
+#   python pdf_index.py search "fundamental rights" --pdf "PB-Polity.pdf"
+# Files are indexed under their file name, which is how PDF_NAMES refers to them.
+
+INDEX_PATH = os.path.join(".cache", "pdf_index.sqlite3")
+CHUNK_WORDS = 220
+CHUNK_OVERLAP = 40  # words repeated between neighbouring chunks so facts are not cut in half
+MAX_CONTEXT_CHUNKS = 8
+SEARCH_CACHE_SIZE = 1024  # queries remembered per index; every batch of a cell asks the same thing
+QUERY_TERM = re.compile(r"\w+")
+
+def extract_pages(path):
+    # Returns the text of each page; plain-text files split pages on form feeds
+    if path.lower().endswith(".txt"):
+        with open(path, encoding="utf-8") as f:
+            return f.read().split("\f")
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        sys.exit("pypdf is required to index PDF files (pip install pypdf).")
+    return [page.extract_text() or "" for page in PdfReader(path).pages]
+
+def chunk_words(text, size=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    words = text.split()
+    step = size - overlap
+    return [" ".join(words[start:start + size]) for start in range(0, max(len(words) - overlap, 1), step) if words[start:start + size]]
+
+def match_query(text):
+    # Any of the terms may match; bm25() does the ranking
+    terms = sorted(set(term.lower() for term in QUERY_TERM.findall(text)))
+    return " OR ".join(f'"{term}"' for term in terms)
+
+class PdfIndex:
+    def __init__(self, path=INDEX_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(
+                text, pdf_name UNINDEXED, page UNINDEXED, tokenize = 'unicode61'
+            );
+        """)
+        self.conn.commit()
+        # Cached per index, so closing one index frees its results and adding a file clears only its own
+        self.search = lru_cache(maxsize=SEARCH_CACHE_SIZE)(self.search_chunks)
+
+    def add_file(self, path):
+        pdf_name = os.path.basename(path)
+        if pdf_name.lower().endswith(".txt"):
+            pdf_name = pdf_name[:-4] + ".pdf"
+        self.conn.execute("DELETE FROM chunks WHERE pdf_name = ?", (pdf_name,))
+        rows = [(chunk, pdf_name, page_number)
+                for page_number, page in enumerate(extract_pages(path), start=1)
+                for chunk in chunk_words(page)]
+        self.conn.executemany("INSERT INTO chunks (text, pdf_name, page) VALUES (?, ?, ?)", rows)
+        self.conn.commit()
+        self.search.cache_clear()
+        return len(rows)
+
+    def pdf_names(self):
+        return [row[0] for row in self.conn.execute("SELECT DISTINCT pdf_name FROM chunks")]
+
+    def is_empty(self):
+        return self.conn.execute("SELECT 1 FROM chunks LIMIT 1").fetchone() is None
+
+    def search_chunks(self, query, pdf_names=(), limit=MAX_CONTEXT_CHUNKS):
+        # Called through self.search; pdf_names is a tuple so results can be cached
+        match = match_query(query)
+        if not match:
+            return []
+        sql = "SELECT pdf_name, page, text FROM chunks WHERE chunks MATCH ?"
+        args = [match]
+        if pdf_names:
+            sql += f" AND pdf_name IN ({','.join('?' * len(pdf_names))})"
+            args.extend(pdf_names)
+        sql += " ORDER BY bm25(chunks) LIMIT ?"
+        args.append(limit)
+        return [{"pdf_name": pdf_name, "page": page, "text": text} for pdf_name, page, text in self.conn.execute(sql, args)]
+
+    def close(self):
+        self.conn.close()
+
+def index_paths(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith((".pdf", ".txt")):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the local reference PDF index.")
+    parser.add_argument("--index", default=INDEX_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="extract, chunk and index PDF or text files")
+    build.add_argument("paths", nargs="+", help="files or directories")
+    search = commands.add_parser("search", help="show the chunks a query retrieves")
+    search.add_argument("query")
+    search.add_argument("--pdf", action="append", default=[], help="restrict to this PDF (repeatable)")
+    search.add_argument("--limit", type=int, default=MAX_CONTEXT_CHUNKS)
+    args = parser.parse_args()
+
+    index = PdfIndex(args.index)
+    try:
+        if args.command == "build":
+            for path in index_paths(args.paths):
+                print(f"{os.path.basename(path)}: {index.add_file(path)} chunks")
+        else:
+            for hit in index.search(args.query, tuple(args.pdf), args.limit):
+                print(f"[{hit['pdf_name']} p.{hit['page']}] {hit['text'][:200]}")
+    finally:
+        index.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,694 @@
+import asyncio
+
+import openai
+
+import time
+
+from batching import BatchPlanner, count_tokens
+from scheduler import RateLimitScheduler, backoff_delay
+from cache import make_cache_key
+from client_pool import create_async_client, pool
+from coverage import CoveragePlanner
+from csv_stream import NOT_FOUND_TEXT, CsvStreamParser, rows_to_csv
+from dedup import NearDuplicateIndex
+from estimator import RETRIEVAL_TOKENS
+from events import GenerationEvents
+from metrics import current_batch, in_batch, percentile, record_retry, record_run, record_usage, span
+from prompts import PROMPT_PREFIX, batch_prompt, build_chat_messages, build_prompt
+
+# Constants
+ASSISTANT_ID = "asst_WejSQNw2pN2DRnUOXpU3vMeX"
+MAX_COMPLETION_TOKENS = 16384
+MODEL_NAME = "gpt-4o-mini"
+MAX_RETRIES = 3
+POLLING_INTERVAL = 0.5  # seconds, first poll of the backoff
+MAX_RUN_TIME = 600  # 10 minutes in seconds
+MAX_QUESTIONS_PER_BATCH = 20
+MAX_PARALLEL_REQUESTS = 50  # ceiling for the adaptive concurrency limit
+STREAM_RUNS = True  # consume run events instead of polling; polling is the fallback
+MAX_POLLING_INTERVAL = 10  # seconds, cap for the polling backoff
+POLLING_BACKOFF = 1.5
+MAX_TOPUP_RATIO = 0.5  # extra questions that may be requested to replace near-duplicates
+MAX_AVOID_QUESTIONS = 40  # already generated questions listed in a top-up prompt
+PREFIX_IN_INSTRUCTIONS = True  # send PROMPT_PREFIX as run instructions rather than in every thread message
+HEDGE_BATCHES = True  # start a duplicate attempt for batches that run much longer than their peers
+HEDGE_PERCENTILE = 0.9  # a batch is hedged once it has run longer than this share of finished batches
+HEDGE_MIN_SAMPLES = 5  # finished batches needed before hedging starts
+HEDGE_MIN_DELAY = 1  # seconds; never hedge sooner than this
+MAX_HEDGE_RATIO = 0.1  # hedged attempts allowed per dispatched batch, to bound the extra cost
+
+# Names of the parameters returned by create_sidebar, in order, with their sidebar defaults
+PARAM_DEFAULTS = {
+    "subjects": [],
+    "topics": [],
+    "sub_topic": "",
+    "selected_pdfs": [],
+    "keywords": "",
+    "question_types": [],
+    "num_questions": 5,
+    "difficulty_levels": [],
+    "language": "English",
+    "question_source": "Rewrite existing",
+    "year_range": (2000, 2024),
+}
+
+def params_from_dict(values):
+    unknown = set(values) - set(PARAM_DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown job parameter(s): {', '.join(sorted(unknown))}")
+    merged = {**PARAM_DEFAULTS, **values}
+    merged["year_range"] = tuple(merged["year_range"])
+    return tuple(merged[name] for name in PARAM_DEFAULTS)
+
+# Direct mode: one streamed chat completion per batch, grounded in excerpts from the local PDF index
+CHAT_ASSISTANT_ID = "chat-completions"  # stands in for ASSISTANT_ID in the cache keys of direct-mode batches
+
+def retrieval_query(params):
+    subjects, topics, sub_topic, selected_pdfs, keywords = params[:5]
+    return " ".join([*topics, sub_topic, keywords]).strip() or " ".join(subjects)
+
+def retrieve_context(params, retriever):
+    return retriever.search(retrieval_query(params), tuple(params[3]))
+
+def run_instructions():
+    # Sent with every run; the thread message then carries only the batch parameters
+    return {"additional_instructions": PROMPT_PREFIX} if PREFIX_IN_INSTRUCTIONS else {}
+
+RUN_ACTIVE_STATUSES = ["queued", "in_progress", "cancelling"]
+
+def emit_lines(pending, text, on_line):
+    # Hands every completed line to the caller as soon as its newline arrives; returns the unfinished tail
+    lines = (pending + text).split('\n')
+    pending = lines.pop()
+    if on_line:
+        for line in lines:
+            on_line(line)
+    return pending
+
+async def stream_run(client, scheduler, thread_id, state, on_line, on_run_started, estimated_tokens):
+    stream = await scheduler.request(
+        client.beta.threads.runs.with_raw_response.create,
+        estimated_tokens=estimated_tokens,
+        thread_id=thread_id,
+        assistant_id=ASSISTANT_ID,
+        model=MODEL_NAME,
+        max_completion_tokens=MAX_COMPLETION_TOKENS,
+        stream=True,
+        **run_instructions()
+    )
+
+    pending = ""
+    async for event in stream:
+        if event.event.startswith("thread.run.") and not event.event.startswith("thread.run.step."):
+            if state["run"] is None and on_run_started:
+                on_run_started(thread_id, event.data.id)
+            state["run"] = event.data
+            record_run(event.data)
+        elif event.event == "thread.message.delta":
+            for part in event.data.delta.content or []:
+                if part.type != "text" or not part.text or not part.text.value:
+                    continue
+                state["text"].append(part.text.value)
+                pending = emit_lines(pending, part.text.value, on_line)
+
+    if pending and on_line:
+        on_line(pending)
+
+async def poll_run(client, scheduler, thread_id, state):
+    interval = POLLING_INTERVAL
+    while state["run"].status in RUN_ACTIVE_STATUSES:
+        await asyncio.sleep(interval)
+        interval = min(interval * POLLING_BACKOFF, MAX_POLLING_INTERVAL)
+        state["run"] = await scheduler.request(client.beta.threads.runs.with_raw_response.retrieve, thread_id=thread_id, run_id=state["run"].id)
+        record_run(state["run"], polled=True)
+
+async def execute_run(client, scheduler, thread_id, state, on_line, on_run_started, estimated_tokens):
+    if STREAM_RUNS:
+        try:
+            await stream_run(client, scheduler, thread_id, state, on_line, on_run_started, estimated_tokens)
+        except (openai.APIConnectionError, openai.BadRequestError):
+            # Streaming is unavailable or the stream dropped; finish the run by polling
+            state["text"] = []
+
+    if state["run"] is None:
+        state["run"] = await scheduler.request(
+            client.beta.threads.runs.with_raw_response.create,
+            estimated_tokens=estimated_tokens,
+            thread_id=thread_id,
+            assistant_id=ASSISTANT_ID,
+            model=MODEL_NAME,
+            max_completion_tokens=MAX_COMPLETION_TOKENS,
+            **run_instructions()
+        )
+        record_run(state["run"])
+        if on_run_started:
+            on_run_started(thread_id, state["run"].id)
+
+    await poll_run(client, scheduler, thread_id, state)
+
+async def stream_chat(client, scheduler, messages, state, on_line, estimated_tokens):
+    stream = await scheduler.request(
+        client.chat.completions.with_raw_response.create,
+        estimated_tokens=estimated_tokens,
+        model=MODEL_NAME,
+        messages=messages,
+        max_completion_tokens=MAX_COMPLETION_TOKENS,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+
+    pending = ""
+    async for chunk in stream:
+        if chunk.usage:
+            state["usage"] = chunk.usage
+        for choice in chunk.choices:
+            if choice.finish_reason:
+                state["finish_reason"] = choice.finish_reason
+            if choice.delta and choice.delta.content:
+                state["text"].append(choice.delta.content)
+                pending = emit_lines(pending, choice.delta.content, on_line)
+
+    if pending and on_line:
+        on_line(pending)
+
+async def generate_questions_chat_async(client, scheduler, messages, events, on_line=None, on_usage=None, estimated_tokens=0):
+    retry_count = 0
+
+    while retry_count < MAX_RETRIES:
+        if retry_count:
+            with span("backoff"):
+                await asyncio.sleep(backoff_delay(retry_count))
+        try:
+            state = {"text": [], "usage": None, "finish_reason": None}
+            try:
+                with span("completion"):
+                    await asyncio.wait_for(stream_chat(client, scheduler, messages, state, on_line, estimated_tokens), MAX_RUN_TIME)
+            except asyncio.TimeoutError:
+                events.warning("Completion took too long. Retrying...")
+                record_retry("timeout")
+                retry_count += 1
+                continue
+
+            if state["usage"]:
+                record_usage(state["usage"])
+            if state["finish_reason"] == "stop":
+                if on_usage:
+                    on_usage(state["usage"])
+                return "".join(state["text"])
+
+            # A cut-off answer ends in a half-written row, like an incomplete run; its tokens were still used
+            if on_usage and state["usage"]:
+                on_usage(state["usage"])
+            events.error(f"Completion ended with finish reason {state['finish_reason']}. Retrying...")
+            record_retry(f"finish_{state['finish_reason']}")
+            retry_count += 1
+
+        except openai.APIError as e:
+            events.error(f"OpenAI API error: {str(e)}")
+            record_retry(f"api_error:{type(e).__name__}")
+            retry_count += 1
+        except Exception as e:
+            events.error(f"An unexpected error occurred: {str(e)}")
+            record_retry(f"error:{type(e).__name__}")
+            retry_count += 1
+
+    events.error(f"Failed to generate questions after {MAX_RETRIES} attempts.")
+    return None
+
+async def fetch_assistant_text(client, scheduler, thread_id):
+    messages = await scheduler.request(client.beta.threads.messages.with_raw_response.list, thread_id=thread_id)
+    assistant_messages = [msg for msg in messages.data if msg.role == "assistant"]
+    if not assistant_messages:
+        return None
+
+    last_message = assistant_messages[-1]
+    return last_message.content[0].text.value
+
+async def resume_run_async(client, scheduler, thread_id, run_id):
+    # Re-attach to a run started before an interruption; None means it has to be regenerated
+    try:
+        state = {"run": await scheduler.request(client.beta.threads.runs.with_raw_response.retrieve, thread_id=thread_id, run_id=run_id)}
+        await asyncio.wait_for(poll_run(client, scheduler, thread_id, state), MAX_RUN_TIME)
+        if state["run"].status == "completed":
+            return await fetch_assistant_text(client, scheduler, thread_id), state["run"].usage
+    except asyncio.TimeoutError:
+        await scheduler.request(client.beta.threads.runs.with_raw_response.cancel, thread_id=thread_id, run_id=run_id)
+    except openai.APIError:
+        pass
+    return None, None
+
+async def cancel_run(client, thread_id, run_id):
+    try:
+        await client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+    except openai.APIError:
+        pass  # already finished, or the cancel itself failed; either way there is nothing more to do
+
+async def generate_questions_batch_async(client, scheduler, params, batch_size, language, events, on_line=None, on_usage=None, estimated_tokens=0, on_run_started=None, avoid_questions=None, repair_rows=None, keep_run=None):
+    # keep_run() is asked when the batch is cancelled: True leaves the run going so a resumed job can re-attach to it
+    prompt = (batch_prompt if PREFIX_IN_INSTRUCTIONS else build_prompt)(params, batch_size, avoid_questions, repair_rows)
+
+    retry_count = 0
+
+    while retry_count < MAX_RETRIES:
+        if retry_count:
+            # Back off with jitter so failing batches do not retry in lockstep
+            with span("backoff"):
+                await asyncio.sleep(backoff_delay(retry_count))
+        try:
+            with span("create_thread"):
+                thread = await scheduler.request(client.beta.threads.with_raw_response.create)
+            with span("create_message"):
+                await scheduler.request(
+                    client.beta.threads.messages.with_raw_response.create,
+                    thread_id=thread.id,
+                    role="user",
+                    content=prompt
+                )
+
+            state = {"run": None, "text": []}
+            try:
+                with span("run"):
+                    await asyncio.wait_for(execute_run(client, scheduler, thread.id, state, on_line, on_run_started, estimated_tokens), MAX_RUN_TIME)
+            except asyncio.CancelledError:
+                # The job gave up on this batch; stop the run too, or it keeps generating and billing
+                if state["run"] is not None and not (keep_run and keep_run()):
+                    await asyncio.shield(cancel_run(client, thread.id, state["run"].id))
+                raise
+            except asyncio.TimeoutError:
+                events.warning("Run took too long. Cancelling and retrying...")
+                record_retry("timeout")
+                if state["run"] is not None:
+                    with span("cancel"):
+                        await scheduler.request(client.beta.threads.runs.with_raw_response.cancel, thread_id=thread.id, run_id=state["run"].id)
+                retry_count += 1
+                continue
+
+            run = state["run"]
+            if run.status == "completed":
+                if on_usage:
+                    on_usage(run.usage)
+                if state["text"]:
+                    return "".join(state["text"])
+
+                with span("fetch_messages"):
+                    csv_content = await fetch_assistant_text(client, scheduler, thread.id)
+                if csv_content is None:
+                    events.error("No assistant response found.")
+                return csv_content  # Return the raw CSV content
+
+            elif run.status in ["failed", "cancelled", "expired", "incomplete"]:
+                if on_usage and run.usage:
+                    on_usage(run.usage)
+                if run.last_error and run.last_error.code == "rate_limit_exceeded":
+                    scheduler.concurrency.on_rate_limited()
+                events.error(f"Run {run.status}. Error: {run.last_error}. Retrying...")
+                record_retry(f"run_{run.status}:{run.last_error.code}" if run.last_error else f"run_{run.status}")
+                retry_count += 1
+            elif run.status == "requires_action":
+                events.error("Run requires action. Retrying...")
+                record_retry("requires_action")
+                retry_count += 1
+
+        except openai.APIError as e:
+            events.error(f"OpenAI API error: {str(e)}")
+            record_retry(f"api_error:{type(e).__name__}")
+            retry_count += 1
+        except Exception as e:
+            events.error(f"An unexpected error occurred: {str(e)}")
+            record_retry(f"error:{type(e).__name__}")
+            retry_count += 1
+
+    events.error(f"Failed to generate questions after {MAX_RETRIES} attempts.")
+    return None
+
+async def generate_questions_parallel_async(params, api_key, num_questions, planner, language, events, cache=None, replay_only=False, journal=None, job_id=None, scheduler=None, metrics=None, client=None, retriever=None, token_budget=None, finish_now=None):
+    # finish_now is an asyncio.Event; setting it returns the finished batches and cancels the rest.
+    # Jobs that share a scheduler share one concurrency and rate-limit budget
+    scheduler = scheduler or RateLimitScheduler(max_concurrency=MAX_PARALLEL_REQUESTS)
+    if client is None:
+        async with create_async_client(api_key, scheduler.concurrency.maximum) as client:
+            return await generate_questions_parallel_async(params, api_key, num_questions, planner, language, events, cache, replay_only,
+                                                           journal, job_id, scheduler, metrics, client, retriever, token_budget, finish_now)
+
+    prompt_occurrences = {}
+
+    def finish(index, batch_size, csv_content, usage, seconds=None):
+        if journal is not None:
+            journal.finish_batch(job_id, index, csv_content, usage, seconds)
+        return index, batch_size, csv_content, usage
+
+    def track(index, batch_size, source):
+        if metrics is None:
+            return None
+        batch = metrics.new_batch(job_id, index, batch_size, batch_cells.get(index), source)
+        batch_metrics[index] = batch
+        return batch
+
+    def attempt(batch_params, batch_size, avoid_questions, messages, on_line, on_run_started, estimated_tokens, usages):
+        if messages is not None:
+            return generate_questions_chat_async(client, scheduler, messages, events, on_line, usages.append, estimated_tokens)
+        # Only a journaled run can be re-attached to, so only those outlive an interrupted job
+        keep_run = (lambda: interrupted) if on_run_started is not None else None
+        return generate_questions_batch_async(client, scheduler, batch_params, batch_size, language, events, on_line, usages.append, estimated_tokens, on_run_started, avoid_questions,
+                                              keep_run=keep_run)
+
+    def may_hedge():
+        return HEDGE_BATCHES and len(batch_seconds) >= HEDGE_MIN_SAMPLES and hedges_started < MAX_HEDGE_RATIO * next_index
+
+    def reserve_hedge(index):
+        # A duplicate may use as many tokens as the original
+        if token_budget is None:
+            return True
+        reserved = batch_reserved.get(index, 0)
+        if not token_budget.reserve(reserved):
+            return False
+        batch_reserved[index] = reserved * 2
+        return True
+
+    async def hedged_attempts(index, batch_params, batch_size, avoid_questions, messages, on_line, on_run_started, estimated_tokens, spent):
+        # Runs the batch, and if it becomes a straggler, a duplicate of it; the first good answer wins
+        # and the other attempt is cancelled, which cancels its run on the server. spent gets the usage
+        # of every attempt, and None for each one cancelled before it reported any
+        nonlocal hedges_started
+        primary_usages = []
+        primary = asyncio.create_task(attempt(batch_params, batch_size, avoid_questions, messages, on_line, on_run_started, estimated_tokens, primary_usages))
+        attempts = {primary: primary_usages}
+        all_usages = [primary_usages]
+        batch = current_batch.get()
+        hedge_record = None
+        try:
+            if may_hedge():
+                await asyncio.wait(attempts, timeout=max(HEDGE_MIN_DELAY, percentile(batch_seconds, HEDGE_PERCENTILE)))
+                if not primary.done() and may_hedge() and reserve_hedge(index):
+                    hedges_started += 1
+                    hedged_batches.add(index)
+                    # The duplicate stays out of the live preview and the journal, and records its own metrics;
+                    # the original owns all three and takes the duplicate's metrics only if it wins
+                    hedge_usages = []
+                    all_usages.append(hedge_usages)
+                    hedge = attempt(batch_params, batch_size, avoid_questions, messages, None, None, estimated_tokens, hedge_usages)
+                    if batch is not None:
+                        batch.hedged = True
+                        hedge_record = batch.attempt_record()
+                        hedge = in_batch(hedge_record, hedge)
+                    attempts[asyncio.create_task(hedge)] = hedge_usages
+
+            error = None
+            while attempts:
+                done, _ = await asyncio.wait(attempts, return_when=asyncio.FIRST_COMPLETED)
+                # On a tie the original wins, since its lines are already in the live preview
+                for task in sorted(done, key=lambda task: task is not primary):
+                    usages = attempts.pop(task)
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                    elif task.result():
+                        if task is not primary and batch is not None:
+                            batch.hedge_won = True
+                            batch.adopt(hedge_record)
+                        return task.result(), usages
+            if error is not None:
+                raise error
+            return None, []
+        finally:
+            for task in attempts:
+                task.cancel()
+            await asyncio.gather(*attempts, return_exceptions=True)
+            for usages in all_usages:
+                spent.extend(usages)
+            spent.extend(None for usages in attempts.values() if not usages)
+
+    async def run_batch(index, batch_params, batch_size, cache_key, avoid_questions, messages=None):
+        batch = track(index, batch_size, "api")
+        current_batch.set(batch)
+        if cache is not None:
+            csv_content = cache.get(cache_key)
+            if csv_content is not None or replay_only:
+                if batch is not None:
+                    batch.source = "cache"
+                return finish(index, batch_size, csv_content, None)
+
+        on_line = lambda line: events.batch_line(index, line)
+        on_run_started = (lambda thread_id, run_id: journal.record_run(job_id, index, thread_id, run_id)) if journal is not None else None
+        usages = []
+        spent = batch_spent[index] = []
+        estimated_tokens = int(batch_size * planner.tokens_per_question())
+        started = None
+        try:
+            async with scheduler.slot():
+                started = time.monotonic()
+                if batch is not None:
+                    batch.slot_acquired()
+                csv_content, usages = await hedged_attempts(index, batch_params, batch_size, avoid_questions, messages, on_line, on_run_started, estimated_tokens, spent)
+            if csv_content:
+                scheduler.concurrency.on_success()
+        except Exception as exc:
+            events.error(f"An error occurred while generating a batch of {batch_size} questions: {str(exc)}")
+            csv_content = None
+        if cache is not None and csv_content:
+            cache.put(cache_key, csv_content)
+        seconds = time.monotonic() - started if started is not None else None
+        if csv_content and seconds is not None:
+            batch_seconds.append(seconds)
+        return finish(index, batch_size, csv_content, usages[-1] if usages else None, seconds)
+
+    async def not_found_batch(index, batch_size):
+        # Nothing in the local index matches this cell, so the model would only say so
+        track(index, batch_size, "index")
+        return finish(index, batch_size, f"{NOT_FOUND_TEXT}.", None)
+
+    async def resume_batch(index, batch_size, thread_id, run_id, cell_index):
+        batch = track(index, batch_size, "api")
+        current_batch.set(batch)
+        async with scheduler.slot():
+            if batch is not None:
+                batch.slot_acquired()
+            csv_content, usage = await resume_run_async(client, scheduler, thread_id, run_id)
+        if csv_content is None and cell_index is not None and cell_index < len(coverage.cells):
+            # The run was cancelled, expired or failed while the job was away: generate the batch again
+            if batch is not None:
+                metrics.close_batch(batch_metrics.pop(index), "failed", 0)
+            cell = coverage.cells[cell_index]
+            return await batch_task(index, cell, batch_size, None, *batch_request(cell, batch_size, None))
+        return finish(index, batch_size, csv_content, usage)
+
+    pending = set()
+    coverage = CoveragePlanner(params, num_questions, planner.cell_capacity())
+    batch_cells = {}
+    batch_metrics = {}
+    batch_reserved = {}
+    batch_spent = {}  # index -> usage of every attempt at the batch, for the token budget
+    hedged_batches = set()
+    batch_seconds = []
+    hedges_started = 0
+    budget_stopped = False
+    finished_early = False
+    interrupted = False  # the job itself was cancelled, as by a Streamlit rerun, rather than told to stop
+    dedup = NearDuplicateIndex()
+    unique_questions = 0
+    in_flight_questions = 0
+    lost_questions = 0
+    requested_questions = 0
+    topup_budget = int(num_questions * MAX_TOPUP_RATIO)
+    next_index = 0
+
+    def accept(index, batch_size, csv_content, usage):
+        # Keep only questions that are not near-duplicates of ones this job already has
+        nonlocal unique_questions, lost_questions, requested_questions
+        cell_index = batch_cells.pop(index, None)
+        batch = batch_metrics.pop(index, None)
+        if not csv_content:
+            if cell_index is not None:
+                coverage.finish(cell_index, batch_size, 0)
+            if batch is not None:
+                metrics.close_batch(batch, "failed", 0)
+            lost_questions += batch_size
+            events.batch_done(index, batch_size, None)
+            return
+        parser = CsvStreamParser()
+        parser.feed(csv_content)
+        parser.close()
+        if usage:
+            planner.observe(usage.completion_tokens, parser.row_count)
+        texts = [" ".join(text for text in pair if text != "N/A")
+                 for pair in zip(parser.data["Question Text (English)"], parser.data["Question Text (Hindi)"])]
+        rows = [row for row, unique in zip(parser.rows(), dedup.add_many(texts)) if unique]
+        unique_questions += len(rows)
+        not_found = not parser.row_count and parser.not_found_count > 0
+        if not_found:
+            # Nothing was generated, so the questions are still to be asked of the cells that remain
+            requested_questions -= batch_size
+        if cell_index is not None:
+            coverage.finish(cell_index, batch_size, len(rows), not_found=not_found)
+        if batch is not None:
+            metrics.close_batch(batch, "not_found" if not_found else "completed", len(rows))
+        kept_csv = rows_to_csv(rows)
+        if journal is not None:
+            # Results read back from the journal get the de-duplicated questions, as the live job did;
+            # a "Not found" reply is kept as it is so a resumed job still counts it
+            journal.keep_questions(job_id, index, csv_content if not_found else kept_csv, len(rows))
+        events.batch_done(index, len(rows), kept_csv)
+
+    def settle(index, usage):
+        # An attempt cancelled before it reported usage is charged what one attempt reserved
+        reserved = batch_reserved.pop(index, 0)
+        spent = batch_spent.pop(index, [usage] if usage else [])
+        attempts = 2 if index in hedged_batches else 1
+        hedged_batches.discard(index)
+        token_budget.settle(reserved, [usage for usage in spent if usage is not None], spent.count(None) * reserved // attempts)
+
+    def needed():
+        return num_questions - unique_questions - in_flight_questions - lost_questions
+
+    def batch_request(cell, batch_size, avoid_questions):
+        # The prompt of one batch of a cell; in direct mode also the chat messages, None when the index has nothing
+        messages = None
+        prompt, assistant_id = build_prompt(cell.params, batch_size, avoid_questions), ASSISTANT_ID
+        if retriever is not None:
+            hits = retrieve_context(cell.params, retriever)
+            if hits:
+                messages = build_chat_messages(cell.params, batch_size, avoid_questions, hits)
+                prompt, assistant_id = "\n".join(message["content"] for message in messages), CHAT_ASSISTANT_ID
+        return prompt, assistant_id, messages
+
+    def batch_task(index, cell, batch_size, avoid_questions, prompt, assistant_id, messages):
+        if retriever is not None and messages is None:
+            return not_found_batch(index, batch_size)
+        # Identical prompts within a job are told apart by how often they occurred
+        seed = prompt_occurrences.get(prompt, 0)
+        prompt_occurrences[prompt] = seed + 1
+        cache_key = make_cache_key(prompt, assistant_id, MODEL_NAME, seed)
+        return run_batch(index, cell.params, batch_size, cache_key, avoid_questions, messages)
+
+    def dispatch():
+        nonlocal next_index, in_flight_questions, requested_questions, topup_budget, budget_stopped
+        batch_size = planner.next_batch_size(needed())
+        avoid_questions = None
+        if requested_questions >= num_questions:
+            # Everything has been asked for once; this batch tops up what duplicates took away
+            if topup_budget <= 0:
+                return False
+            batch_size = min(batch_size, topup_budget)
+            avoid_questions = dedup.avoid_list(MAX_AVOID_QUESTIONS)
+        cell, batch_size = coverage.next_batch(batch_size)
+        if cell is None:
+            return False
+        prompt, assistant_id, messages = batch_request(cell, batch_size, avoid_questions)
+        reserved = 0
+        if token_budget is not None and (retriever is None or messages is not None):
+            prior = count_tokens(prompt, MODEL_NAME) + (0 if messages is not None else RETRIEVAL_TOKENS)
+            reserved = int(token_budget.input_estimate(prior) + batch_size * planner.tokens_per_question())
+            if not token_budget.reserve(reserved):
+                coverage.finish(cell.index, batch_size, 0)
+                # With batches in flight their reservations may free up room; with none, this batch never fits
+                budget_stopped = not pending
+                return False
+        if avoid_questions is not None:
+            topup_budget -= batch_size
+        if journal is not None:
+            journal.start_batch(job_id, next_index, batch_size, cell.index)
+        batch_cells[next_index] = cell.index
+        batch_reserved[next_index] = reserved
+        pending.add(asyncio.create_task(batch_task(next_index, cell, batch_size, avoid_questions, prompt, assistant_id, messages)))
+        next_index += 1
+        in_flight_questions += batch_size
+        requested_questions += batch_size
+        return True
+
+    # Replay what an interrupted job already paid for and re-attach to runs still on the server
+    if journal is not None:
+        for batch in journal.batches(job_id):
+            next_index = max(next_index, batch["batch_index"] + 1)
+            replayed = batch["status"] == "completed" or (batch["status"] == "running" and batch["run_id"])
+            if replayed and batch["cell_index"] is not None and batch["cell_index"] < len(coverage.cells):
+                coverage.start(batch["cell_index"], batch["batch_size"])
+                batch_cells[batch["batch_index"]] = batch["cell_index"]
+            if batch["status"] == "completed":
+                requested_questions += batch["batch_size"]
+                track(batch["batch_index"], batch["batch_size"], "journal")
+                accept(batch["batch_index"], batch["batch_size"], batch["csv_content"], None)
+            elif batch["status"] == "running" and batch["run_id"]:
+                requested_questions += batch["batch_size"]
+                in_flight_questions += batch["batch_size"]
+                pending.add(asyncio.create_task(resume_batch(batch["batch_index"], batch["batch_size"], batch["thread_id"], batch["run_id"], batch["cell_index"])))
+
+    # Batches are sized one at a time as slots free up, so later batches use the measured usage
+    stop_waiter = asyncio.ensure_future(finish_now.wait()) if finish_now is not None else None
+    try:
+        while True:
+            if stop_waiter is not None and stop_waiter.done():
+                finished_early = True
+                break
+            while needed() > 0 and len(pending) < int(scheduler.concurrency.limit) and dispatch():
+                pass
+            if not pending:
+                break
+
+            done, _ = await asyncio.wait(pending | ({stop_waiter} if stop_waiter is not None else set()), return_when=asyncio.FIRST_COMPLETED)
+            pending -= done
+            for task in done - {stop_waiter}:
+                index, batch_size, csv_content, usage = task.result()
+                in_flight_questions -= batch_size
+                accept(index, batch_size, csv_content, usage)
+                if token_budget is not None:
+                    settle(index, usage)
+            if token_budget is not None and token_budget.exhausted():
+                budget_stopped = True
+                break
+    except asyncio.CancelledError:
+        interrupted = journal is not None
+        raise
+    finally:
+        if stop_waiter is not None:
+            stop_waiter.cancel()
+        # The loop may outlive this job (see client_pool), so a cancelled job must not leave batches running
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    if budget_stopped:
+        cancelled = f" and cancelled {len(pending)} running batches" if pending else ""
+        events.warning(f"Token budget of {token_budget.limit} tokens reached ({token_budget.spent} used): stopped sending batches{cancelled} "
+                       f"with {unique_questions}/{num_questions} questions.")
+    if finished_early:
+        cancelled = f"; cancelled {len(pending)} running batches" if pending else ""
+        events.warning(f"Finished early with {unique_questions}/{num_questions} questions{cancelled}.")
+
+    if coverage.dropped_sources:
+        events.warning(f"Stopped asking about {', '.join(coverage.dropped_labels())}: the knowledge base kept answering \"Not found\".")
+    if dedup.duplicate_count:
+        events.warning(f"Removed {dedup.duplicate_count} near-duplicate questions; {unique_questions}/{num_questions} unique questions kept.")
+
+    # Jobs with failed batches stay open so the next attempt only fills the gaps
+    if journal is not None and (unique_questions >= num_questions or (not lost_questions and not budget_stopped and not finished_early)):
+        journal.finish_job(job_id)
+
+def generate_questions(params, api_key, events=None, cache=None, replay_only=False, journal=None, job_id=None, max_concurrency=MAX_PARALLEL_REQUESTS, metrics=None, retriever=None, token_budget=None):
+    question_types, num_questions, language = params[5], params[6], params[8]
+    planner = BatchPlanner(question_types, language, MAX_COMPLETION_TOKENS, MAX_QUESTIONS_PER_BATCH, MODEL_NAME)
+    scheduler = RateLimitScheduler(max_concurrency=max_concurrency)
+
+    # Runs on the process-wide loop so every job reuses the key's pooled connections
+    async def run_job(events):
+        client = pool.async_client(api_key)
+        await generate_questions_parallel_async(params, api_key, num_questions, planner, language, events, cache, replay_only,
+                                                journal, job_id, scheduler, metrics, client, retriever, token_budget)
+
+    pool.run(run_job, events or GenerationEvents())
+
+def combine_csv_content(all_csv_content):
+    if not all_csv_content:
+        return None
+
+    # Combine all CSV content
+    combined_csv_content = '\n'.join(all_csv_content)
+
+    # Keep the first header only and drop empty lines and code fences
+    lines = combined_csv_content.split('\n')
+    header = next((line for line in lines if is_header_line(line)), lines[0])
+    data_lines = [line for line in lines if line.strip() and not is_header_line(line) and not line.lstrip().startswith("```")]
+    final_csv_content = header + '\n' + '\n'.join(data_lines)
+
+    return final_csv_content
+
+def is_header_line(line):
+    return "Subject" in line and "Topic" in line and "Question Type" in line
@@ -0,0 +1,96 @@
+from batching import count_tokens
+from csv_stream import EXPECTED_COLUMNS, NOT_FOUND_TEXT, rows_to_csv
+
+# Every prompt is PROMPT_PREFIX followed by a short parameter block for the batch. The prefix is
+# byte-identical for every batch of every job, so the provider can serve it from its prompt cache,
+# and with PREFIX_IN_INSTRUCTIONS it is sent as run instructions instead of in the thread message.
+
+COLUMN_HEADER = ", ".join(f'"{column}"' for column in EXPECTED_COLUMNS)
+
+PROMPT_PREFIX = f"""You are an advanced AI assistant designed to generate high-quality exam questions for UPSC and other public service commission exams in India. You will use a comprehensive Knowledge Base (KB) of Previous Year Questions (PYQs) provided in the attached PDF files. Your goal is to emulate expert examiners' methods, ensuring precision, consistency, and adherence to the requested specifications.
+
+# Instructions:
+
+Follow all the detailed steps provided previously to generate high-quality exam questions. Each request ends with its Batch Parameters; a parameter that is not listed is unrestricted. Strictly adhere to the output format, a CSV-friendly format with the following headers:
+
+{COLUMN_HEADER}
+
+**Important Notes:**
+- Ensure all fields are populated correctly; if a field is not applicable or a value is missing, leave that column blank instead of skipping it.
+- Do not include any text before or after the CSV content.
+- **Ensure that every column is properly mapped** in the exact sequence specified in the header.
+- Ensure that the Correct Answer (English) field contains the full text of the correct option.
+- Explanations should be detailed, at least 2-3 paragraphs, and explain why other options are not suitable.
+- Use only information that can be directly verified from the Knowledge Base.
+- If no relevant entry is found in the Knowledge Base, respond with: "{NOT_FOUND_TEXT}."
+"""
+
+# Direct mode sends the prefix as part of the system message, ahead of the retrieved excerpts
+CHAT_SYSTEM_PROMPT = """You are an expert examiner who writes exam questions for UPSC, SSC and state public service commission exams in India.
+The user message starts with excerpts from the Knowledge Base of Previous Year Questions, each labelled with its PDF name and page.
+Use only facts that can be verified from those excerpts, cite the PDF name and page each question is based on, and answer with CSV only.
+
+""" + PROMPT_PREFIX
+
+def batch_parameters(params, batch_size):
+    subjects, topics, sub_topic, selected_pdfs, keywords, question_types, num_questions, difficulty_levels, language_param, question_source, year_range = params
+
+    lines = [
+        ("Subject(s)", ", ".join(subjects)),
+        ("Topic(s)", ", ".join(topics)),
+        ("Sub-Topic", sub_topic),
+        ("Keywords", keywords),
+        ("Question Type(s)", ", ".join(question_types)),
+        ("Number of Questions", batch_size),
+        ("Difficulty Level(s)", ", ".join(difficulty_levels)),
+        ("Language", language_param),
+        ("Question Source", question_source),
+        ("Year Range", f"{year_range[0]} to {year_range[1]}"),
+        ("Reference Material", ", ".join(selected_pdfs)),
+    ]
+    return "# Batch Parameters:\n" + "".join(f"- {name}: {value}\n" for name, value in lines if value)
+
+def avoid_section(avoid_questions):
+    if not avoid_questions:
+        return ""
+    listed = "\n".join(f"- {question[:200]}" for question in avoid_questions)
+    return f"""
+# Already Generated:
+The following questions have already been generated. Do not repeat them, paraphrase them, or test the same fact in the same way:
+{listed}
+"""
+
+def repair_section(repair_rows):
+    # repair_rows are (fields, issues) pairs of generated rows that failed validation
+    if not repair_rows:
+        return ""
+    listed = "\n".join(f"- Row {i}: {issues}" for i, (_, issues) in enumerate(repair_rows, 1))
+    return f"""
+# Rows to Repair:
+These rows failed validation for the reasons listed. Return a corrected version of every row, in the same order and output format:
+{listed}
+
+{rows_to_csv([fields for fields, _ in repair_rows])}"""
+
+def batch_prompt(params, batch_size, avoid_questions=None, repair_rows=None):
+    # The part of a prompt that changes from batch to batch
+    return batch_parameters(params, batch_size) + avoid_section(avoid_questions) + repair_section(repair_rows)
+
+def build_prompt(params, batch_size, avoid_questions=None, repair_rows=None):
+    return PROMPT_PREFIX + "\n" + batch_prompt(params, batch_size, avoid_questions, repair_rows)
+
+def build_chat_messages(params, batch_size, avoid_questions, hits, repair_rows=None):
+    excerpts = "\n\n".join(f"[{hit['pdf_name']}, page {hit['page']}]\n{hit['text']}" for hit in hits)
+    return [
+        {"role": "system", "content": CHAT_SYSTEM_PROMPT},
+        # Excerpts come before the batch block, so batches of the same cell share everything but the tail
+        {"role": "user", "content": f"# Knowledge Base Excerpts\n\n{excerpts}\n\n" + batch_prompt(params, batch_size, avoid_questions, repair_rows)},
+    ]
+
+def prompt_token_counts(params, batch_size, avoid_questions=None, model="gpt-4o"):
+    # Exact tiktoken counts for each part of a batch's prompt
+    return {
+        "prefix": count_tokens(PROMPT_PREFIX + "\n", model),
+        "parameters": count_tokens(batch_parameters(params, batch_size), model),
+        "avoid": count_tokens(avoid_section(avoid_questions), model) if avoid_questions else 0,
+    }
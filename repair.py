@@ -0,0 +1,92 @@
+import asyncio
+
+import pandas as pd
+
+from client_pool import pool
+from csv_stream import EXPECTED_COLUMNS, CsvStreamParser
+from pipeline import (MAX_AVOID_QUESTIONS, MAX_PARALLEL_REQUESTS, GenerationEvents, generate_questions_batch_async,
+                      generate_questions_chat_async, retrieve_context)
+from prompts import build_chat_messages
+from results import compact
+from scheduler import RateLimitScheduler
+from validation import BLANK_VALUES, issue_labels, missing_count, validate_questions
+
+# Sends the rows that fail validation back to the model a few at a time, with the reasons they
+# failed, and asks for the questions a job is still short of. A repaired row replaces the
+# original only if it fails fewer checks.
+
+REPAIR_BATCH_SIZE = 5  # rows per repair batch; small batches keep a bad answer from costing much
+MAX_REPAIR_ROUNDS = 2  # repaired rows are validated again, and the ones still failing retried once
+
+def parse_questions(csv_content):
+    parser = CsvStreamParser()
+    parser.feed(csv_content or "")
+    parser.close()
+    return pd.DataFrame(parser.data, columns=EXPECTED_COLUMNS)
+
+async def repair_questions_async(client, scheduler, df, params, events, retriever=None):
+    # Returns the repaired questions and a summary of what changed
+    num_questions, language, year_range = params[6], params[8], params[10]
+    # Plain strings while rows are swapped in; the compact dtypes are restored at the end
+    df = df[EXPECTED_COLUMNS].reset_index(drop=True).astype(object).fillna("")
+    summary = {"repaired": 0, "added": 0, "batches": 0}
+
+    async def run_repair(batch_size, repair_rows=None, avoid_questions=None):
+        async with scheduler.slot():
+            if retriever is not None:
+                # As in a job, a query the local index has nothing for is not worth a request
+                hits = retrieve_context(params, retriever)
+                if not hits:
+                    return parse_questions(None)
+                messages = build_chat_messages(params, batch_size, avoid_questions, hits, repair_rows)
+                return parse_questions(await generate_questions_chat_async(client, scheduler, messages, events))
+            return parse_questions(await generate_questions_batch_async(client, scheduler, params, batch_size, language, events,
+                                                                        avoid_questions=avoid_questions, repair_rows=repair_rows))
+
+    for _ in range(MAX_REPAIR_ROUNDS):
+        issues = validate_questions(df, language, year_range)
+        failing = df.index[issues.any(axis=1)]
+        missing = missing_count(df, num_questions)
+        if not len(failing) and not missing:
+            break
+
+        labels = issue_labels(issues)
+        chunks = [failing[start:start + REPAIR_BATCH_SIZE] for start in range(0, len(failing), REPAIR_BATCH_SIZE)]
+        repairs = [run_repair(len(chunk), [(list(df.loc[i, EXPECTED_COLUMNS]), labels[i]) for i in chunk]) for chunk in chunks]
+        passing = df.loc[~issues.any(axis=1), "Question Text (English)"].where(lambda text: ~text.isin(BLANK_VALUES), df["Question Text (Hindi)"])
+        avoid_questions = passing.tolist()[-MAX_AVOID_QUESTIONS:]
+        additions = [run_repair(min(REPAIR_BATCH_SIZE, missing - start), avoid_questions=avoid_questions)
+                     for start in range(0, missing, REPAIR_BATCH_SIZE)]
+        summary["batches"] += len(repairs) + len(additions)
+        results = await asyncio.gather(*repairs, *additions)
+
+        failed_checks = issues.sum(axis=1)
+        for chunk, repaired in zip(chunks, results[:len(chunks)]):
+            # Rows come back in the order they were sent; any the model dropped stay as they were
+            count = min(len(chunk), len(repaired))
+            if not count:
+                continue
+            originals = chunk[:count]
+            repaired = repaired.iloc[:count].set_axis(originals)
+            better = validate_questions(repaired, language, year_range).sum(axis=1) < failed_checks[originals]
+            df.loc[originals[better.to_numpy()], EXPECTED_COLUMNS] = repaired.loc[better, EXPECTED_COLUMNS]
+            summary["repaired"] += int(better.sum())
+
+        added = [new_rows for new_rows in results[len(chunks):] if len(new_rows)]
+        if added:
+            new_rows = pd.concat(added, ignore_index=True).iloc[:missing]
+            df = pd.concat([df, new_rows], ignore_index=True)
+            summary["added"] += len(new_rows)
+
+    issues = validate_questions(df, language, year_range)
+    summary["still_failing"] = int(issues.any(axis=1).sum())
+    summary["missing"] = missing_count(df, num_questions)
+    return compact(df), summary
+
+def repair_questions(results, params, api_key, events=None, retriever=None, max_concurrency=MAX_PARALLEL_REQUESTS):
+    # Blocking entry point for the app; returns the repaired results and the summary
+    async def run_repairs(events):
+        client = pool.async_client(api_key)
+        return await repair_questions_async(client, RateLimitScheduler(max_concurrency=max_concurrency), results, params, events, retriever)
+
+    return pool.run(run_repairs, events or GenerationEvents())
@@ -0,0 +1,51 @@
+import pandas as pd
+
+from csv_stream import EXPECTED_COLUMNS, CsvStreamParser
+
+# Generated questions are kept in one compact frame per session instead of as raw CSV text plus
+# processed copies: repeated labels are categoricals, free text is Arrow-backed strings and the
+# numeric columns are small nullable integers. CSV text is only built when it is downloaded.
+
+CATEGORY_COLUMNS = ["Subject", "Topic", "Sub-Topic", "Question Type", "Difficulty Level", "Language", "Source PDF Name"]
+NUMERIC_COLUMNS = ["Source Page Number", "Original Question Number", "Year of Original Question"]
+TEXT_DTYPE = "string[pyarrow]"
+PAGE_SIZE = 100  # rows sent to the browser at a time
+
+def compact(df):
+    columns = {}
+    for col in EXPECTED_COLUMNS:
+        if col in CATEGORY_COLUMNS:
+            columns[col] = df[col].astype("category")
+        elif col in NUMERIC_COLUMNS:
+            columns[col] = pd.to_numeric(df[col], errors="coerce").astype("Int32")
+        else:
+            columns[col] = df[col].astype(TEXT_DTYPE)
+    return pd.DataFrame(columns)
+
+def compact_results(csv_content):
+    # None when there is nothing to show; a response without a CSV header is an error unless it was "Not found"
+    parser = CsvStreamParser()
+    parser.feed(csv_content or "")
+    parser.close()
+    if not parser.header_seen and not parser.not_found_count and csv_content and csv_content.strip():
+        raise ValueError("CSV header is missing in the assistant's response.")
+    if not parser.row_count:
+        return None
+    return compact(pd.DataFrame(parser.data, columns=EXPECTED_COLUMNS))
+
+def results_to_csv(df, columns=EXPECTED_COLUMNS):
+    return df[list(columns)].to_csv(index=False, lineterminator="\n")
+
+def language_columns(language):
+    # The columns worth showing for the language the questions were generated in
+    if language == "Hindi":
+        return [col for col in EXPECTED_COLUMNS if "Hindi" in col or "(" not in col]
+    if language == "English":
+        return [col for col in EXPECTED_COLUMNS if "Hindi" not in col]
+    return list(EXPECTED_COLUMNS)
+
+def page_count(rows, page_size=PAGE_SIZE):
+    return max(1, -(-rows // page_size))
+
+def page_slice(page, page_size=PAGE_SIZE):
+    return slice((page - 1) * page_size, page * page_size)
@@ -0,0 +1,245 @@
+import asyncio
+import collections
+import contextlib
+import random
+import re
+import time
+
+import openai
+
+from metrics import current_batch
+
+INITIAL_CONCURRENCY = 8
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 200
+CONCURRENCY_DECREASE = 0.5  # multiplicative cut on a 429
+DECREASE_COOLDOWN = 5  # seconds; 429s from requests already in flight count as one event
+MAX_REQUEST_RETRIES = 6
+BACKOFF_BASE = 1  # seconds
+BACKOFF_CAP = 60  # seconds
+
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+def parse_duration(value):
+    # Rate-limit reset headers look like "1s", "6m0s" or "20ms"
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+def parse_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def retry_after_seconds(headers):
+    retry_after_ms = parse_int(headers.get("retry-after-ms"))
+    if retry_after_ms is not None:
+        return retry_after_ms / 1000
+    return parse_duration(headers.get("retry-after"))
+
+def backoff_delay(attempt, retry_after=None):
+    # Full jitter, never shorter than what the server asked for
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+    return max(delay, retry_after or 0)
+
+class TokenBucket:
+    def __init__(self):
+        self.capacity = None  # unlimited until the server reports a limit
+        self.rate = None
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        if self.capacity is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        while True:
+            self.refill()
+            if self.capacity is None or amount <= 0:
+                return
+            amount = min(amount, self.capacity)
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def update(self, limit, remaining, reset_seconds):
+        if not limit or remaining is None:
+            return
+        self.refill()
+        first_update = self.capacity is None
+        self.capacity = limit
+        # Refill fast enough to be full again when the server's window resets
+        if reset_seconds and remaining < limit:
+            self.rate = max((limit - remaining) / reset_seconds, limit / 60)
+        else:
+            self.rate = limit / 60
+        self.tokens = remaining if first_update else min(self.tokens, remaining)
+
+class AIMDConcurrency:
+    def __init__(self, initial=INITIAL_CONCURRENCY, minimum=MIN_CONCURRENCY, maximum=MAX_CONCURRENCY):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.condition = asyncio.Condition()
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            async with self.condition:
+                self.in_flight -= 1
+                self.condition.notify_all()
+
+    def on_success(self):
+        # Additive increase: about one extra slot per full window of successes
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def on_rate_limited(self):
+        now = time.monotonic()
+        if now - self.last_decrease > DECREASE_COOLDOWN:
+            self.limit = max(self.minimum, self.limit * CONCURRENCY_DECREASE)
+            self.last_decrease = now
+
+class RateLimitScheduler:
+    def __init__(self, initial_concurrency=INITIAL_CONCURRENCY, max_concurrency=MAX_CONCURRENCY):
+        self.requests = TokenBucket()
+        self.tokens = TokenBucket()
+        self.concurrency = AIMDConcurrency(min(initial_concurrency, max_concurrency), MIN_CONCURRENCY, max_concurrency)
+        self.paused_until = 0.0
+        self.rate_limited_count = 0
+
+    def observe_headers(self, headers):
+        self.requests.update(
+            parse_int(headers.get("x-ratelimit-limit-requests")),
+            parse_int(headers.get("x-ratelimit-remaining-requests")),
+            parse_duration(headers.get("x-ratelimit-reset-requests")),
+        )
+        self.tokens.update(
+            parse_int(headers.get("x-ratelimit-limit-tokens")),
+            parse_int(headers.get("x-ratelimit-remaining-tokens")),
+            parse_duration(headers.get("x-ratelimit-reset-tokens")),
+        )
+
+    async def wait_until_resumed(self):
+        delay = self.paused_until - time.monotonic()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self.paused_until - time.monotonic()
+
+    def slot(self):
+        return self.concurrency.slot()
+
+    async def request(self, raw_method, estimated_tokens=0, **kwargs):
+        # raw_method is a with_raw_response endpoint so the rate-limit headers are visible
+        batch = current_batch.get()
+        attempt = 0
+        while True:
+            throttle_start = time.monotonic()
+            await self.wait_until_resumed()
+            await self.requests.acquire(1)
+            await self.tokens.acquire(estimated_tokens)
+            if batch is not None:
+                batch.throttle_wait += time.monotonic() - throttle_start
+                batch.api_calls += 1
+            try:
+                response = await raw_method(**kwargs)
+            except openai.RateLimitError as e:
+                if e.code == "insufficient_quota":
+                    raise
+                self.rate_limited_count += 1
+                if batch is not None:
+                    batch.rate_limited += 1
+                self.observe_headers(e.response.headers)
+                self.concurrency.on_rate_limited()
+                retry_after = retry_after_seconds(e.response.headers)
+                if retry_after:
+                    # Everyone waits out an explicit retry-after, not just this request
+                    self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+                attempt += 1
+                if attempt > MAX_REQUEST_RETRIES:
+                    raise
+                await asyncio.sleep(backoff_delay(attempt, retry_after))
+                continue
+            except (openai.APIConnectionError, openai.InternalServerError):
+                if batch is not None:
+                    batch.request_retries += 1
+                attempt += 1
+                if attempt > MAX_REQUEST_RETRIES:
+                    raise
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+
+            self.observe_headers(response.headers)
+            return response.parse()
+
+class FairSlots:
+    # Hands out a shared concurrency limit round-robin between owners, so one user's big job
+    # cannot hold every slot while another user's batches wait behind it
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+        self.waiting = collections.OrderedDict()  # owner -> waiting futures, in turn order
+
+    def grant(self):
+        while self.waiting and self.concurrency.in_flight < int(self.concurrency.limit):
+            owner, futures = next(iter(self.waiting.items()))
+            future = futures.popleft()
+            if futures:
+                self.waiting.move_to_end(owner)
+            else:
+                del self.waiting[owner]
+            if not future.done():
+                self.concurrency.in_flight += 1
+                future.set_result(None)
+
+    def release(self):
+        self.concurrency.in_flight -= 1
+        self.grant()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, owner):
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.setdefault(owner, collections.deque()).append(future)
+        self.grant()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # granted just as the batch was cancelled
+            raise
+        try:
+            yield
+        finally:
+            self.release()
+
+class OwnerScheduler:
+    # One owner's view of a shared scheduler: the same rate limits and concurrency, with slots from FairSlots
+    def __init__(self, scheduler, fair_slots, owner):
+        self.scheduler = scheduler
+        self.fair_slots = fair_slots
+        self.owner = owner
+        self.concurrency = scheduler.concurrency
+
+    def slot(self):
+        return self.fair_slots.slot(self.owner)
+
+    def request(self, raw_method, estimated_tokens=0, **kwargs):
+        return self.scheduler.request(raw_method, estimated_tokens, **kwargs)
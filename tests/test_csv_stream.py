@@ -0,0 +1,42 @@
+import random
+
+from csv_stream import EXPECTED_COLUMNS, CsvStreamParser
+
+HEADER = ",".join(EXPECTED_COLUMNS)
+
+def parse(text, chunk_size=None):
+    parser = CsvStreamParser()
+    chunk_size = chunk_size or len(text)
+    for start in range(0, len(text), chunk_size):
+        parser.feed(text[start:start + chunk_size])
+    parser.close()
+    return [row[:6] for row in parser.rows()]
+
+def test_stray_quote_in_unquoted_field():
+    text = f'{HEADER}\nGK,Height,x,MCQ,He is 5" tall,b\nGK,T,x,MCQ,next,row\nGK,T,x,MCQ,last,row\n'
+    for chunk_size in [None, 7]:
+        assert parse(text, chunk_size) == [
+            ("GK", "Height", "x", "MCQ", 'He is 5" tall', "b"),
+            ("GK", "T", "x", "MCQ", "next", "row"),
+            ("GK", "T", "x", "MCQ", "last", "row"),
+        ]
+
+def test_stray_quotes_joining_lines_are_read_literally():
+    # Two stray quotes make the quote count even again, joining the lines between them into one record
+    text = f'{HEADER}\nGK,Height,x,MCQ,He is 5" tall,b\nGK,T,x,MCQ,next,row\nGK,Width,x,MCQ,6" wide,c\n'
+    rows = parse(text)
+    assert rows[:2] == [("GK", "Height", "x", "MCQ", 'He is 5" tall', "b"), ("GK", "T", "x", "MCQ", "next", "row")]
+    # The last quote is still open when the response ends, so it is closed like a truncated field
+    assert rows[2][:5] == ("GK", "Width", "x", "MCQ", '6" wide')
+
+def test_quoted_field_spanning_lines():
+    text = f'{HEADER}\nGK,T,x,MCQ,"first line\nsecond line",b\n'
+    assert parse(text, 5) == [("GK", "T", "x", "MCQ", "first line\nsecond line", "b")]
+
+def test_random_stray_quotes_never_raise():
+    rng = random.Random(0)
+    fields = ["plain", 'He is 5" tall', '"quoted, text"', '"open', '"two\nlines"']
+    text = HEADER + "\n" + "".join(f"GK,T{i},x,MCQ,{rng.choice(fields)},b\n" for i in range(200))
+    for chunk_size in [None, 3, 50]:
+        rows = parse(text, chunk_size)
+        assert 0 < len(rows) <= 400
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+import pipeline
+from batching import BatchPlanner
+from coverage import CoveragePlanner
+from estimator import TokenBudget, plan_batches
+from events import GenerationEvents
+from fake_server import FakeAssistantsServer
+from journal import JobJournal
+
+PARAMS = pipeline.params_from_dict({"num_questions": 40})
+
+class RecordingEvents(GenerationEvents):
+    def __init__(self):
+        self.warnings = []
+
+    def warning(self, message):
+        self.warnings.append(message)
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = JobJournal(str(tmp_path / "journal.sqlite3"))
+    yield journal
+    journal.close()
+
+def start_server(monkeypatch, **kwargs):
+    server = FakeAssistantsServer(**kwargs).start()
+    monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+    return server
+
+def run_job(journal, job_id, events=None, token_budget=None):
+    planner = BatchPlanner([], "English", pipeline.MAX_COMPLETION_TOKENS, 5, pipeline.MODEL_NAME)
+    return pipeline.generate_questions_parallel_async(PARAMS, "fake-key", 40, planner, "English", events or GenerationEvents(),
+                                                      journal=journal, job_id=job_id, token_budget=token_budget)
+
+async def interrupt(job, seconds):
+    task = asyncio.create_task(job)
+    await asyncio.sleep(seconds)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+@pytest.mark.parametrize("cancel_runs", [False, True])
+def test_resume_after_interrupt(monkeypatch, journal, cancel_runs):
+    server = start_server(monkeypatch, run_seconds=1)
+    try:
+        job_id = journal.create_job(PARAMS)
+        asyncio.run(interrupt(run_job(journal, job_id), 0.5))
+        # An interrupted job leaves its runs going on the server, for the resume to pick up
+        batches = journal.batches(job_id)
+        assert [batch["status"] for batch in batches] == ["running"] * 8
+        assert server.stats["cancelled"] == 0
+        if cancel_runs:
+            # Runs that died while the job was away are generated again
+            for batch in batches:
+                server.finish_run(batch["run_id"], "cancelled")
+
+        asyncio.run(run_job(journal, job_id))
+        assert journal.job(job_id)["status"] == "completed"
+        assert journal.completed_questions(job_id) == 40
+        assert server.stats["runs"] == (16 if cancel_runs else 8)
+    finally:
+        server.stop()
+
+def test_budget_that_covers_the_job_completes_it(monkeypatch, journal):
+    server = start_server(monkeypatch, run_seconds=0.2)
+    try:
+        job_id = journal.create_job(PARAMS)
+        events = RecordingEvents()
+        # Reservations outrun the budget while batches are in flight, but what they really spend fits
+        budget = TokenBudget(40000)
+        asyncio.run(run_job(journal, job_id, events, budget))
+        assert journal.job(job_id)["status"] == "completed"
+        assert journal.completed_questions(job_id) == 40
+        assert not budget.exhausted()
+        assert events.warnings == []
+    finally:
+        server.stop()
+
+@pytest.mark.parametrize("subjects", [[], ["English for SSC - All exams"], ["English for SSC - All exams", "General Knowledge", "Mathematics"]])
+def test_coverage_batches_fill_the_planner_capacity(subjects):
+    params = pipeline.params_from_dict({"subjects": subjects, "question_types": ["Multiple Choice"], "num_questions": 500})
+    planner = BatchPlanner(params[5], params[8], pipeline.MAX_COMPLETION_TOKENS, pipeline.MAX_QUESTIONS_PER_BATCH, pipeline.MODEL_NAME)
+    capacity = planner.batch_capacity()
+    batches = plan_batches(params, 500, planner)
+    assert [size for _, size in batches] == [capacity] * (500 // capacity)
+
+def test_not_found_moves_the_quota_to_a_reserve_cell():
+    params = pipeline.params_from_dict({"subjects": ["English for SSC - All exams"], "num_questions": 40})
+    coverage = CoveragePlanner(params, 40, 20)
+    cell, size = coverage.next_batch(20)
+    coverage.finish(cell.index, size, 0, not_found=True)
+    coverage.start(cell.index, size)
+    coverage.finish(cell.index, size, 0, not_found=True)
+    assert cell.dropped
+    assert sum(c.quota for c in coverage.active_cells()) == 40
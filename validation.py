@@ -0,0 +1,98 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# Checks every generated question in one vectorized pass over the columns. Rows that fail can be
+# sent back as small repair batches (see repair.py) instead of being cleaned up by hand.
+
+CHECKS = {
+    "missing_question": "no question text",
+    "missing_options": "fewer than two options",
+    "answer_not_an_option": "correct answer is not one of the options",
+    "unpaired_translation": "English and Hindi fields do not match up",
+    "year_out_of_range": "year outside the selected range",
+}
+OPTION_LETTERS = "ABCD"
+CHOICE_TYPES = r"mcq|multiple|match"  # question types that need options, with the answer among them
+TRUE_FALSE_TYPES = r"true|false"
+TRUE_FALSE_ANSWERS = ["true", "false", "सत्य", "असत्य", "सही", "गलत"]
+PAIRED_FIELDS = ["Question Text", "Option A", "Option B", "Option C", "Option D", "Correct Answer", "Explanation"]
+BLANK_VALUES = ["", "N/A"]
+
+# "B", "(b)", "Option B", "B) <option text>"
+ANSWER_LETTER = re.compile(r"^\(?(?:option\s*)?\(?([a-d])\)?(?:[.):]\s*|\s+|$)(.*)$", re.IGNORECASE)
+# Devanagari vowel signs are not \w, so they are kept explicitly
+NON_WORD = r"[^\wऀ-ॿ]+"
+
+def text(series):
+    # Works for object, string and categorical columns alike
+    return series.astype(object).fillna("").astype(str)
+
+def languages_for(language):
+    return ["English", "Hindi"] if language == "Both" else [language]
+
+def normalized(frame):
+    # Lowercased, punctuation-free text of every cell, as an array shaped like the frame; blanks are ""
+    flat = text(pd.Series(frame.to_numpy(dtype=object).ravel())).str.strip()
+    flat = flat.where(~flat.isin(BLANK_VALUES), "")
+    flat = flat.str.lower().str.replace(NON_WORD, " ", regex=True).str.strip()
+    return flat.to_numpy().reshape(frame.shape)
+
+def answer_among_options(df, language):
+    options = normalized(df[[f"Option {letter} ({language})" for letter in OPTION_LETTERS]])
+    answer_column = text(df[f"Correct Answer ({language})"]).str.strip()
+    answer = normalized(df[[f"Correct Answer ({language})"]])[:, 0]
+    by_text = ((options == answer[:, None]) & (options != "")).any(axis=1)
+
+    # Answers given as the option letter, alone or followed by the option text
+    parts = answer_column.str.extract(ANSWER_LETTER)
+    letter = parts[0].str.upper().map({letter: i for i, letter in enumerate(OPTION_LETTERS)})
+    chosen = options[np.arange(len(df)), letter.fillna(0).astype(int).to_numpy()]
+    rest = normalized(parts[[1]])[:, 0]
+    by_letter = letter.notna().to_numpy() & (chosen != "") & ((rest == "") | (rest == chosen))
+    return by_text | by_letter, options, answer
+
+def validate_questions(df, language, year_range):
+    # df has the EXPECTED_COLUMNS, as parsed or compacted; returns one boolean column per check
+    question_type = text(df["Question Type"])
+    choice = question_type.str.contains(CHOICE_TYPES, case=False).to_numpy()
+    true_false = question_type.str.contains(TRUE_FALSE_TYPES, case=False).to_numpy() & ~choice
+    issues = {check: np.zeros(len(df), dtype=bool) for check in CHECKS}
+
+    question_blank = normalized(df[[f"Question Text ({lang})" for lang in ["English", "Hindi"]]]) == ""
+    required = [["English", "Hindi"].index(lang) for lang in languages_for(language)]
+    issues["missing_question"] = question_blank[:, required].all(axis=1)
+
+    for lang in languages_for(language):
+        answered, options, answer = answer_among_options(df, lang)
+        option_count = (options != "").sum(axis=1)
+        issues["missing_options"] |= choice & (option_count < 2)
+        # True/False questions may leave the options blank and answer with the word itself
+        answered_true_false = (option_count == 0) & np.isin(answer, TRUE_FALSE_ANSWERS)
+        issues["answer_not_an_option"] |= (choice & ~answered) | (true_false & ~answered & ~answered_true_false)
+
+    if language == "Both":
+        english = normalized(df[[f"{field} (English)" for field in PAIRED_FIELDS]]) == ""
+        hindi = normalized(df[[f"{field} (Hindi)" for field in PAIRED_FIELDS]]) == ""
+        issues["unpaired_translation"] = (english != hindi).any(axis=1)
+
+    # Only years that are given are checked; new questions have no original year
+    year = pd.to_numeric(df["Year of Original Question"], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    issues["year_out_of_range"] = (year > 0) & ((year < year_range[0]) | (year > year_range[1]))
+
+    return pd.DataFrame(issues, index=df.index)
+
+def issue_labels(issues):
+    # "; "-joined descriptions of every failed check, "" for rows that pass
+    labels = pd.Series("", index=issues.index)
+    for check, label in CHECKS.items():
+        labels = labels.where(~issues[check], labels + label + "; ")
+    return labels.str.rstrip("; ")
+
+def issue_summary(issues):
+    counts = issues.sum()
+    return ", ".join(f"{counts[check]} {label}" for check, label in CHECKS.items() if counts[check])
+
+def missing_count(df, num_questions):
+    return max(0, num_questions - len(df))
@@ -0,0 +1,189 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from batching import BatchPlanner
+from cache import ResponseCache
+from client_pool import create_async_client
+from estimator import TokenBudget
+from journal import JobJournal
+from metrics import MetricsRecorder
+from pdf_index import PdfIndex
+from pipeline import (MAX_COMPLETION_TOKENS, MAX_PARALLEL_REQUESTS, MAX_QUESTIONS_PER_BATCH, MODEL_NAME, PARAM_DEFAULTS,
+                      GenerationEvents, combine_csv_content, generate_questions_parallel_async, params_from_dict)
+from scheduler import FairSlots, OwnerScheduler, RateLimitScheduler
+
+# Background job service. The app queues jobs in the journal (JobJournal.submit_job) and this
+# process runs them, all under one concurrency and rate-limit budget shared fairly by owner:
+#   OPENAI_API_KEY=... python worker.py run
+#   python worker.py status [JOB_ID]
+#   python worker.py result JOB_ID -o questions.csv
+#   python worker.py stop JOB_ID
+
+POLL_INTERVAL = 1.0  # seconds between checks for new jobs and stop requests
+MAX_ACTIVE_JOBS = 8  # jobs planned at once; their batches still share the one concurrency limit
+FINISHED_STATUSES = ["completed", "stopped", "incomplete", "failed"]
+
+class WorkerEvents(GenerationEvents):
+    def __init__(self, journal, job):
+        self.journal = journal
+        self.job_id = job["job_id"]
+        self.num_questions = job["num_questions"]
+        self.completed_questions = 0
+
+    def log(self, message):
+        print(f"[{self.job_id}] {message}", file=sys.stderr, flush=True)
+
+    def error(self, message):
+        self.log(f"ERROR {message}")
+        self.journal.set_job_message(self.job_id, message)
+
+    def warning(self, message):
+        self.log(f"WARNING {message}")
+        self.journal.set_job_message(self.job_id, message)
+
+    def batch_done(self, index, question_count, csv_content):
+        if csv_content:
+            self.completed_questions += question_count
+            self.log(f"Generated {self.completed_questions}/{self.num_questions} questions")
+
+def next_jobs(queued, running_owners, limit):
+    # Oldest job of the owner with the fewest running jobs first, so nobody's queue starves
+    picked = []
+    counts = dict(running_owners)
+    queued = list(queued)
+    while queued and len(picked) < limit:
+        job = min(queued, key=lambda job: (counts.get(job["owner"], 0), job["created_at"]))
+        queued.remove(job)
+        picked.append(job)
+        counts[job["owner"]] = counts.get(job["owner"], 0) + 1
+    return picked
+
+class Worker:
+    def __init__(self, api_key, max_concurrency, journal_path=None, metrics_jsonl=None):
+        self.api_key = api_key
+        self.journal = JobJournal(journal_path) if journal_path else JobJournal()
+        self.scheduler = RateLimitScheduler(max_concurrency=max_concurrency)
+        self.fair_slots = FairSlots(self.scheduler.concurrency)
+        self.metrics = MetricsRecorder(metrics_jsonl)
+        self.cache = ResponseCache()
+        self.active = {}  # job_id -> (job, finish_now event, task)
+
+    async def run_job(self, client, job, finish_now):
+        job_id, options = job["job_id"], job["options"]
+        params = params_from_dict(dict(zip(PARAM_DEFAULTS, job["params"])))
+        language = params[8]
+        events = WorkerEvents(self.journal, job)
+        retriever = PdfIndex() if options.get("mode") == "direct" else None
+        token_budget = TokenBudget(options["token_budget"]) if options.get("token_budget") else None
+        planner = BatchPlanner(params[5], language, MAX_COMPLETION_TOKENS, MAX_QUESTIONS_PER_BATCH, MODEL_NAME)
+        cache = self.cache if options.get("use_cache", True) else None
+        events.log(f"Started for {job['owner']}: {job['num_questions']} questions")
+        try:
+            await generate_questions_parallel_async(params, self.api_key, job["num_questions"], planner, language, events, cache,
+                                                    options.get("replay_only", False), self.journal, job_id,
+                                                    OwnerScheduler(self.scheduler, self.fair_slots, job["owner"]),
+                                                    self.metrics, client, retriever, token_budget, finish_now)
+            # The pipeline closes the job itself when every batch made it
+            if self.journal.job(job_id)["status"] == "running":
+                self.journal.set_job_status(job_id, "stopped" if finish_now.is_set() else "incomplete")
+        except Exception as e:
+            events.error(f"Job failed: {e}")
+            self.journal.set_job_status(job_id, "failed")
+        finally:
+            if retriever is not None:
+                retriever.close()
+            del self.active[job_id]
+
+    def start(self, client, job):
+        # The loop only keeps weak references to tasks, so the worker holds on to every running job
+        finish_now = asyncio.Event()
+        self.active[job["job_id"]] = (job, finish_now, asyncio.create_task(self.run_job(client, job, finish_now)))
+
+    async def run(self):
+        async with create_async_client(self.api_key, self.scheduler.concurrency.maximum) as client:
+            # Jobs still marked running were interrupted with a previous worker; the journal resumes them
+            for job in self.journal.jobs_with_status("running"):
+                if job["owner"] is not None:
+                    self.start(client, job)
+            try:
+                while True:
+                    for job_id, (job, finish_now, _) in list(self.active.items()):
+                        if not finish_now.is_set() and self.journal.job(job_id)["stop_requested"]:
+                            finish_now.set()
+                    queued = [job for job in self.journal.jobs_with_status("queued")]
+                    for job in queued:
+                        if job["stop_requested"]:
+                            self.journal.claim_job(job["job_id"], "stopped")
+                    running_owners = {}
+                    for job, _, _ in self.active.values():
+                        running_owners[job["owner"]] = running_owners.get(job["owner"], 0) + 1
+                    for job in next_jobs([job for job in queued if not job["stop_requested"]], running_owners, MAX_ACTIVE_JOBS - len(self.active)):
+                        # Another worker may have taken the job since it was listed
+                        if self.journal.claim_job(job["job_id"]):
+                            self.start(client, job)
+                    await asyncio.sleep(POLL_INTERVAL)
+            finally:
+                # Cancelled jobs stay marked running and resume when the worker starts again
+                tasks = [task for _, _, task in self.active.values()]
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+def print_status(journal, job_id=None):
+    jobs = [journal.job(job_id)] if job_id else journal.jobs_with_status("queued", "running", *FINISHED_STATUSES)[-20:]
+    for job in jobs:
+        if job is None:
+            sys.exit(f"No job {job_id}")
+        done = journal.completed_questions(job["job_id"])
+        started = time.strftime("%Y-%m-%d %H:%M", time.localtime(job["created_at"]))
+        print(f"{job['job_id']}  {job['status']:<10} {done}/{job['num_questions']} questions  {started}  {job['owner'] or 'app'}"
+              + (f"  ({job['message']})" if job["message"] else ""))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run queued generation jobs, or inspect them.")
+    parser.add_argument("--journal", help="journal database (default: the app's)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="process the queue until interrupted")
+    run.add_argument("--concurrency", type=int, default=MAX_PARALLEL_REQUESTS, help="maximum runs in flight across all jobs")
+    run.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"), help="defaults to $OPENAI_API_KEY")
+    run.add_argument("--metrics-jsonl", help="append one JSON line of metrics per finished batch to this file")
+    status = commands.add_parser("status", help="show recent jobs, or one job")
+    status.add_argument("job_id", nargs="?")
+    result = commands.add_parser("result", help="write a job's questions as CSV")
+    result.add_argument("job_id")
+    result.add_argument("-o", "--output", help="output file (default: stdout)")
+    stop = commands.add_parser("stop", help="finish a job with the batches it has")
+    stop.add_argument("job_id")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        if not args.api_key:
+            parser.error("an API key is required (--api-key or OPENAI_API_KEY)")
+        try:
+            asyncio.run(Worker(args.api_key, args.concurrency, args.journal, args.metrics_jsonl).run())
+        except KeyboardInterrupt:
+            pass  # running jobs stay marked running and resume when the worker starts again
+        return 0
+
+    journal = JobJournal(args.journal) if args.journal else JobJournal()
+    try:
+        if args.command == "status":
+            print_status(journal, args.job_id)
+        elif args.command == "stop":
+            journal.request_stop(args.job_id)
+        else:
+            csv_content = combine_csv_content(journal.completed_csv(args.job_id)) or ""
+            if args.output:
+                with open(args.output, "w", encoding="utf-8") as f:
+                    f.write(csv_content)
+            else:
+                sys.stdout.write(csv_content)
+    finally:
+        journal.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())